@@ -1,7 +1,15 @@
-from .download import fetch_html_source,parse_html_content,download_worker
+from .download import (
+    fetch_html_source,
+    parse_html_content,
+    download_one,
+    download_files,
+    download_worker,
+)
 
 __all__=[
     "fetch_html_source",
     "parse_html_content",
+    "download_one",
+    "download_files",
     "download_worker"
-]
\ No newline at end of file
+]
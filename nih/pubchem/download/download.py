@@ -11,16 +11,25 @@
 **********************************************************"""
 import re
 import os
+import asyncio
 import time
-import subprocess
-from typing import List
+import email.utils
+from typing import Callable, List, Optional
 import urllib.request
 
+import aiohttp
+import aiofiles
+
 from nih.pubchem.types import FileNode
 
 
 MAX_RETRIES = 2  # 最大重试次数 (不含首次)
-RETRY_DELAY = 5  # 重试间隔 (秒)
+RETRY_DELAY = 5  # 重试间隔 (秒), 每次重试翻倍
+MAX_CONCURRENCY = 32  # 共享连接池的最大并发连接数
+KEEPALIVE_TIMEOUT = 60  # keep-alive 连接空闲保留时间 (秒)
+CHUNK_SIZE = 1 << 20  # 流式写盘块大小 (1 MiB)
+
+_RATE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
 
 
 # 2. 获取 HTML 源码 (保持不变)
@@ -37,68 +46,173 @@ def fetch_html_source(target_url):
         return None
 
 
-# 3. 解析函数 (保持不变)
+# Apache 目录列表中的一行: <a href="...">name</a>  2025-01-01 00:00  1.2G
+# 负向前瞻排除 "Parent Directory" 所在行; [ \t] 保证匹配不跨行
+_LISTING_RE = re.compile(
+    r'<a href="(?![^\n]*Parent Directory)([^"]+)">([^<]+)</a>[ \t]+(\d{4}-\d{2}-\d{2} \d{2}:\d{2})[ \t]+([0-9\.]+[KMGTP]?)'
+)
+
+
+# 3. 解析函数: 对整段 HTML 做一次 finditer 扫描, 不再逐行切分
 def parse_html_content(html_text) -> List[FileNode]:
-    results = []
-    pattern = re.compile(
-        r'<a href="([^"]+)">([^<]+)</a>\s+(\d{4}-\d{2}-\d{2} \d{2}:\d{2})\s+([0-9\.]+[KMGTP]?)'
-    )
     if not html_text:
-        return results
+        return []
+    return [
+        FileNode(name.strip(), href.strip(), last_mod, size)
+        for href, name, last_mod, size in (
+            m.groups() for m in _LISTING_RE.finditer(html_text)
+        )
+    ]
 
-    for line in html_text.split("\n"):
-        if "Parent Directory" in line:
-            continue
-        match = pattern.search(line)
-        if match:
-            href, name, last_mod, size = match.groups()
-            results.append(
-                FileNode(name.strip(), href.strip(), last_mod.strip(), size.strip())
-            )
-    return results
 
+def parse_rate(limit_rate: str | None) -> Optional[float]:
+    """
+    解析 wget 风格的限速字符串 ("500K", "2M", "1024"), 返回 bytes/s
+    """
+    if not limit_rate:
+        return None
+    text = limit_rate.strip().upper()
+    unit = text[-1] if text[-1] in _RATE_UNITS else ""
+    number = text[: len(text) - len(unit)]
+    return float(number) * _RATE_UNITS[unit]
 
-# 4. [修改] 单个文件的下载逻辑 (Worker 函数)
-def download_worker(
-    file_node: FileNode, base_url, output_dir, limit_rate: str | None = None,tries:int=3
+
+class TokenBucket:
+    """
+    令牌桶限速器, 替代 wget 的 --limit-rate
+
+    所有下载协程共享同一个桶, 因此限制的是总带宽而不是单个文件的带宽
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, CHUNK_SIZE)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: int) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                # 大于桶容量的块在桶满时放行并透支, 由后续调用补足等待, 否则会永远等待
+                need = min(amount, self.capacity)
+                if self._tokens >= need:
+                    self._tokens -= amount
+                    return
+                await asyncio.sleep((need - self._tokens) / self.rate)
+
+
+def _stamp_mtime(path, last_modified: Optional[str]) -> None:
+    """
+    把本地文件的 mtime 设为服务器的 Last-Modified (同 wget -N), 下次请求据此发送 If-Range
+    """
+    if not last_modified or not os.path.exists(path):
+        return
+    try:
+        ts = email.utils.parsedate_to_datetime(last_modified).timestamp()
+    except (TypeError, ValueError):
+        return
+    os.utime(path, (ts, ts))
+
+
+# 4. [修改] 单个文件的下载逻辑 (协程)
+async def download_one(
+    session: aiohttp.ClientSession,
+    file_node: FileNode,
+    base_url,
+    output_dir,
+    limiter: Optional[TokenBucket] = None,
+    tries: int = 1 + MAX_RETRIES,
 ):
     """
-    运行在子进程中的下载函数
-    返回: (Success: bool, Message: str, URL: str, FileName: str)
+    在共享 session 上下载单个文件, 支持 Range 断点续传与指数退避重试
+    已有的本地文件带 If-Range (本地 mtime, 即上次下载时的 Last-Modified) 续传:
+    远端文件未变化时返回 206 续写 / 416 已完整; 远端文件更新过则服务器返回 200, 整个重新下载
+    返回: (Success: bool, Message: str, URL: str, FileNode)
     """
     full_url = base_url + file_node.href
-
-    # 确保目录存在 (多进程中通常由主进程创建更好，但也为了健壮性保留)
+    path = os.path.join(output_dir, file_node.file_name)
+
+    message = "Failed after retries"
+    for attempt in range(tries):
+        existing_size = os.path.getsize(path) if os.path.exists(path) else 0
+        headers = {}
+        if existing_size:
+            headers["Range"] = f"bytes={existing_size}-"
+            headers["If-Range"] = email.utils.formatdate(os.path.getmtime(path), usegmt=True)
+        try:
+            async with session.get(full_url, headers=headers) as resp:
+                # 416: 本地文件已完整且远端未变化 (请求的起点超出文件末尾)
+                if resp.status == 416:
+                    return True, "Success", full_url, file_node
+                resp.raise_for_status()
+                # 服务器忽略 Range (或 If-Range 不匹配) 时返回 200 全量内容, 需要覆盖重写
+                mode = "ab" if resp.status == 206 else "wb"
+                try:
+                    async with aiofiles.open(path, mode) as f:
+                        async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                            if limiter:
+                                await limiter.acquire(len(chunk))
+                            await f.write(chunk)
+                finally:
+                    # 中断的部分文件也要标记, 否则下次续传时 If-Range 不匹配
+                    _stamp_mtime(path, resp.headers.get("Last-Modified"))
+            return True, "Success", full_url, file_node
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            message = str(e) or type(e).__name__
+            if attempt + 1 < tries:
+                # 等待后重试
+                await asyncio.sleep(RETRY_DELAY * (2**attempt))
+    return False, message, full_url, file_node
+
+
+async def download_files(
+    file_nodes: List[FileNode],
+    base_url,
+    output_dir,
+    limit_rate: str | None = None,
+    tries: int = 1 + MAX_RETRIES,
+    max_concurrency: int = MAX_CONCURRENCY,
+    on_done: Optional[Callable[[tuple], None]] = None,
+) -> List[tuple]:
+    """
+    单进程并发下载: 所有请求复用同一个 keep-alive 连接池
+    on_done: 每个文件结束 (成功或失败) 时以结果元组调用, 用于更新进度条
+    """
     os.makedirs(output_dir, exist_ok=True)
+    limiter = TokenBucket(parse_rate(limit_rate)) if limit_rate else None
+    semaphore = asyncio.Semaphore(max_concurrency)
+    connector = aiohttp.TCPConnector(
+        limit=max_concurrency, keepalive_timeout=KEEPALIVE_TIMEOUT
+    )
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=300)
 
-    # 构造命令:
-    # -q: 安静模式 (必须加，否则会打乱 rich 的进度条)
-    # -c: 断点续传
-    # -N: 只有比本地新才下载
-    # -P: 指定目录
-    # --limit-rate: 限速
-    # --tries:重试次数
-    cmd = ["wget", "-q", "-c", "-N", "-P",f"--tries={tries}", output_dir, full_url]
-    if limit_rate:
-        cmd.append(f"--limit-rate={limit_rate}")
-
-    attempts = 0
-    # 总尝试次数 = 1次首次 + MAX_RETRIES次重试
-    total_attempts = 1 + MAX_RETRIES
-
-    while attempts < total_attempts:
-        try:
-            # 运行命令
-            subprocess.run(cmd, check=True)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
 
-            return True, "Success", full_url, file_node
+        async def run(node: FileNode) -> tuple:
+            async with semaphore:
+                result = await download_one(
+                    session, node, base_url, output_dir, limiter, tries
+                )
+            if on_done:
+                on_done(result)
+            return result
 
-        except subprocess.CalledProcessError:
-            attempts += 1
-            if attempts < total_attempts:
-                # 等待后重试
-                time.sleep(RETRY_DELAY)
-            else:
-                return False, "Failed after retries", full_url, file_node
-        except Exception as e:
-            return False, str(e), full_url, file_node
+        return await asyncio.gather(*(run(node) for node in file_nodes))
+
+
+def download_worker(
+    file_node: FileNode, base_url, output_dir, limit_rate: str | None = None, tries: int = 3
+):
+    """
+    同步下载单个文件 (兼容旧调用方式), 批量下载请使用 download_files
+    返回: (Success: bool, Message: str, URL: str, FileNode)
+    """
+    return asyncio.run(
+        download_files([file_node], base_url, output_dir, limit_rate, tries)
+    )[0]
@@ -0,0 +1,515 @@
+# -*- coding: utf-8 -*-
+"""
+Record-boundary scanner for SDF text used by SDFIndexBuilder.
+
+scan_records() walks a buffer holding whole lines of an SDF file and returns, per
+complete record (terminated by $$$$), its offsets and the CID / parent CID /
+conformer_id extracted from the property blocks, as parallel NumPy arrays. The
+byte-level kernel runs as C when the cffi extension is built (_sdf_scan_build.py),
+else JIT-compiled with numba; otherwise a find()-based Python scanner with the same
+semantics is used.
+"""
+from __future__ import annotations
+
+from typing import Dict, NamedTuple
+
+import numpy as np
+
+try:  # optional: JIT for the byte-level scanner
+    import numba
+except ImportError:
+    numba = None
+
+try:  # optional: C kernel (_sdf_scan_c.c), built by _sdf_scan_build.py
+    from nih.pubchem.index._sdf_scan_cffi import ffi as _ffi, lib as _lib
+except ImportError:
+    _ffi = _lib = None
+
+# Field kind bits: one field name may serve several roles
+FIELD_CID = 1
+FIELD_PARENT_CID = 2
+FIELD_CONFID = 4
+
+# Longest digit string accepted as a CID (keeps the value inside int64)
+MAX_CID_DIGITS = 18
+
+# Records per kernel call: the kernel fills a fixed (SCAN_BATCH, 6) output and returns,
+# the caller resumes at the last record boundary (no array growth inside the loop)
+SCAN_BATCH = 1 << 16
+
+# Field-name hash: 48-bit polynomial, never overflows int64 (in numba or Python)
+_HASH_MUL = 131
+_HASH_MASK = (1 << 48) - 1
+
+
+class FieldTable(NamedTuple):
+    """Normalized field name -> FIELD_* mask, plus the same set in array form for the kernel."""
+
+    kinds: Dict[str, int]
+    hashes: np.ndarray  # int64, hash of each name
+    masks: np.ndarray  # int64
+    names: np.ndarray  # uint8, names concatenated
+    offsets: np.ndarray  # int64, names[offsets[i]:offsets[i + 1]]
+
+
+class ScanResult(NamedTuple):
+    """Parallel per-record arrays; -1 marks a missing CID / parent CID / conformer_id."""
+
+    starts: np.ndarray  # int64, record start offset in the buffer
+    ends: np.ndarray  # int64, offset just past the $$$$ line
+    cids: np.ndarray  # int64
+    parent_cids: np.ndarray  # int64
+    confid_offs: np.ndarray  # int64, conformer_id value is buf[off:off + len]
+    confid_lens: np.ndarray  # int64
+    consumed: int  # offset just past the last complete record
+
+
+def _name_hash(name: bytes) -> int:
+    h = 0
+    for c in name:
+        h = (h * _HASH_MUL + c) & _HASH_MASK
+    return h
+
+
+def make_field_table(kinds: Dict[str, int]) -> FieldTable:
+    """Build the scanner's lookup table from normalized (stripped, upper-case) names."""
+    encoded = [(n.encode("utf-8"), m) for n, m in kinds.items()]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(n) for n, _ in encoded], dtype=np.int64)
+    return FieldTable(
+        kinds=dict(kinds),
+        hashes=np.array([_name_hash(n) for n, _ in encoded], dtype=np.int64),
+        masks=np.array([m for _, m in encoded], dtype=np.int64),
+        names=np.frombuffer(b"".join(n for n, _ in encoded), dtype=np.uint8).copy(),
+        offsets=offsets,
+    )
+
+
+# -----------------------------
+# Byte-level kernel (numba.njit when available)
+# -----------------------------
+
+
+def _is_ws(c) -> bool:
+    # bytes.strip() whitespace
+    return c == 32 or 9 <= c <= 13
+
+
+def _is_name_ws(c) -> bool:
+    # str.strip() (as in _norm_field_name) also removes the \x1c-\x1f separators
+    return c == 32 or 9 <= c <= 13 or 28 <= c <= 31
+
+
+def _is_digits(buf, a, b) -> bool:
+    if a >= b or b - a > MAX_CID_DIGITS:
+        return False
+    for i in range(a, b):
+        if not 48 <= buf[i] <= 57:
+            return False
+    return True
+
+
+def _parse_int(buf, a, b) -> int:
+    v = 0
+    for i in range(a, b):
+        v = v * 10 + (buf[i] - 48)
+    return v
+
+
+def _field_mask(buf, a, b, f_hash, f_mask, f_names, f_off) -> int:
+    # normalize like _norm_field_name (ASCII): strip, then upper-case on the fly
+    while a < b and _is_name_ws(buf[a]):
+        a += 1
+    while b > a and _is_name_ws(buf[b - 1]):
+        b -= 1
+    h = 0
+    for i in range(a, b):
+        c = buf[i]
+        if 97 <= c <= 122:
+            c -= 32
+        h = (h * _HASH_MUL + c) & _HASH_MASK
+    for k in range(len(f_hash)):
+        if f_hash[k] != h or f_off[k + 1] - f_off[k] != b - a:
+            continue
+        j = f_off[k]
+        same = True
+        for i in range(a, b):
+            c = buf[i]
+            if 97 <= c <= 122:
+                c -= 32
+            if c != f_names[j]:
+                same = False
+                break
+            j += 1
+        if same:
+            return f_mask[k]
+    return 0
+
+
+def _skip_molfile(buf, pos) -> int:
+    # start of the next line beginning with ">", or with "$" after leading blanks
+    # (an indented $$$$ still ends the record); len(buf) if there is none
+    n = len(buf)
+    while pos < n and buf[pos] != 62:
+        q = pos
+        while q < n and buf[q] != 10 and _is_ws(buf[q]):
+            q += 1
+        if q < n and buf[q] == 36:
+            break
+        while q < n and buf[q] != 10:
+            q += 1
+        pos = q + 1
+    return pos
+
+
+def _finalize(buf, mask, have_val, vs, ve, cid, parent, c_off, c_len):
+    # apply the pending field: value is buf[vs:ve] (first non-blank line, stripped)
+    if mask and have_val:
+        if _is_digits(buf, vs, ve):
+            if mask & FIELD_CID and cid < 0:
+                cid = _parse_int(buf, vs, ve)
+            if mask & FIELD_PARENT_CID and parent < 0:
+                parent = _parse_int(buf, vs, ve)
+        if mask & FIELD_CONFID and c_off < 0:
+            c_off = vs
+            c_len = ve - vs
+    return cid, parent, c_off, c_len
+
+
+def _scan_kernel(buf, pos, eof, compound, f_hash, f_mask, f_names, f_off, out):
+    """
+    Scan buf[pos:] into out[i] = (start, end, cid, parent_cid, confid_off, confid_len).
+    Returns (count, consumed); count == len(out) means out is full and the scan should
+    be resumed at `consumed`.
+    """
+    n = len(buf)
+    cap = out.shape[0]
+    count = 0
+
+    rec_start = pos
+    title_seen = False
+    in_prop = False
+    cur_mask = 0
+    have_val = False
+    vs = 0
+    ve = 0
+    cid = -1
+    parent = -1
+    c_off = -1
+    c_len = 0
+    molfile = False  # just past the title line, in the counts/atom/bond block
+
+    while pos < n and count < cap:
+        # Molfile block (up to M  END): only a "> <" or $$$$ line can change state,
+        # so other lines are skipped looking at their leading bytes only
+        if molfile:
+            molfile = False
+            if not in_prop:
+                pos = _skip_molfile(buf, pos)
+                if pos >= n:
+                    break
+
+        nl = pos
+        while nl < n and buf[nl] != 10:
+            nl += 1
+        if nl < n:
+            end = nl + 1
+        elif eof:
+            end = n  # last line without trailing newline
+        else:
+            break  # partial line: belongs to the next buffer
+        start = pos
+        pos = end
+
+        # line with surrounding whitespace stripped: [a, b)
+        a = start
+        b = end
+        while a < b and _is_ws(buf[a]):
+            a += 1
+        while b > a and _is_ws(buf[b - 1]):
+            b -= 1
+
+        # First line of record (title); for compound files it is often the CID
+        if not title_seen:
+            title_seen = True
+            molfile = True
+            if compound and _is_digits(buf, a, b):
+                cid = _parse_int(buf, a, b)
+
+        # Property header line: > <FIELDNAME>
+        if (
+            b > start + 3
+            and buf[start] == 62
+            and buf[start + 1] == 32
+            and buf[start + 2] == 60
+            and buf[b - 1] == 62
+        ):
+            cid, parent, c_off, c_len = _finalize(
+                buf, cur_mask, have_val, vs, ve, cid, parent, c_off, c_len
+            )
+            # field name: between "> <" and the next ">"
+            q = start + 3
+            while buf[q] != 62:
+                q += 1
+            if q > start + 3:
+                cur_mask = _field_mask(buf, start + 3, q, f_hash, f_mask, f_names, f_off)
+                in_prop = True
+            else:
+                cur_mask = 0
+                in_prop = False
+            have_val = False
+            continue
+
+        # Property value ends at blank line; first non-blank line is the value
+        if in_prop:
+            if a == b:
+                cid, parent, c_off, c_len = _finalize(
+                    buf, cur_mask, have_val, vs, ve, cid, parent, c_off, c_len
+                )
+                cur_mask = 0
+                have_val = False
+                in_prop = False
+            elif not have_val:
+                have_val = True
+                vs = a
+                ve = b
+
+        # Record terminator
+        if (
+            b - a == 4
+            and buf[a] == 36
+            and buf[a + 1] == 36
+            and buf[a + 2] == 36
+            and buf[a + 3] == 36
+        ):
+            cid, parent, c_off, c_len = _finalize(
+                buf, cur_mask, have_val, vs, ve, cid, parent, c_off, c_len
+            )
+            out[count, 0] = rec_start
+            out[count, 1] = end
+            out[count, 2] = cid
+            out[count, 3] = parent
+            out[count, 4] = c_off
+            out[count, 5] = c_len
+            count += 1
+
+            # reset record state
+            rec_start = end
+            title_seen = False
+            molfile = False
+            in_prop = False
+            cur_mask = 0
+            have_val = False
+            cid = -1
+            parent = -1
+            c_off = -1
+            c_len = 0
+
+    return count, rec_start
+
+
+if numba is not None:
+    _is_ws = numba.njit(cache=True, inline="always")(_is_ws)
+    _is_name_ws = numba.njit(cache=True, inline="always")(_is_name_ws)
+    _is_digits = numba.njit(cache=True)(_is_digits)
+    _parse_int = numba.njit(cache=True)(_parse_int)
+    _field_mask = numba.njit(cache=True)(_field_mask)
+    _skip_molfile = numba.njit(cache=True)(_skip_molfile)
+    _finalize = numba.njit(cache=True)(_finalize)
+    _scan_kernel_jit = numba.njit(cache=True, nogil=True)(_scan_kernel)
+else:
+    _scan_kernel_jit = None
+
+
+def _scan_kernel_c(buf, pos, eof, compound, f_hash, f_mask, f_names, f_off, out):
+    # same contract as _scan_kernel; arrays are passed to C without copying
+    consumed = _ffi.new("int64_t *")
+    count = _lib.sdf_scan(
+        _ffi.from_buffer("uint8_t[]", buf), len(buf), pos, eof, compound,
+        _ffi.from_buffer("int64_t[]", f_hash), _ffi.from_buffer("int64_t[]", f_mask),
+        _ffi.from_buffer("uint8_t[]", f_names), _ffi.from_buffer("int64_t[]", f_off),
+        len(f_hash), _ffi.from_buffer("int64_t[]", out), out.shape[0], consumed,
+    )
+    return count, consumed[0]
+
+
+# -----------------------------
+# Python fallback (find()-based, same semantics)
+# -----------------------------
+
+
+def _digits_value(v: bytes) -> int:
+    # int() parses bytes directly (no decode); isdigit() keeps "+1", " 1", "1_0" out,
+    # as in the kernel
+    return int(v) if len(v) <= MAX_CID_DIGITS and v.isdigit() else -1
+
+
+def _find_dollar_line(buf, lo: int) -> int:
+    # index of the newline (at or after lo) before the next line whose first non-blank
+    # byte is "$", or -1; "$" is rare in molfile blocks, so few candidates are checked
+    p = buf.find(b"$", lo)
+    while p >= 0:
+        nl = buf.rfind(b"\n", lo, p)
+        if nl >= 0 and not buf[nl + 1 : p].strip():
+            return nl
+        p = buf.find(b"$", p + 1)
+    return -1
+
+
+def _finalize_py(mask, val_start, val, cid, parent, c_off, c_len):
+    if mask and val_start >= 0:
+        want_cid = mask & FIELD_CID and cid < 0
+        want_parent = mask & FIELD_PARENT_CID and parent < 0
+        if want_cid or want_parent:
+            d = _digits_value(val)
+            if want_cid:
+                cid = d
+            if want_parent:
+                parent = d
+        if mask & FIELD_CONFID and c_off < 0:
+            c_off, c_len = val_start, len(val)
+    return cid, parent, c_off, c_len
+
+
+def _scan_py(buf, eof: bool, compound: bool, kinds: Dict[str, int]):
+    starts, ends, cids, parents, c_offs, c_lens = [], [], [], [], [], []
+    n = len(buf)
+
+    rec_start = 0
+    title_seen = False
+    in_prop = False
+    cur_mask = 0
+    val_start = -1  # offset of the current field's first value line (stripped), -1 if none
+    val: bytes = b""
+    cid = parent = c_off = -1
+    c_len = 0
+    molfile = False  # just past the title line, in the counts/atom/bond block
+    # next "\n>" / dollar line (see _find_dollar_line) at or after the current line;
+    # -2 not searched yet, -1 none left
+    next_gt = next_dollar = -2
+    name_masks: Dict[bytes, int] = {}  # raw header name -> FIELD_* mask
+
+    pos = 0
+    while pos < n:
+        # Molfile block (up to M  END): only a "> <" or $$$$ line can change state,
+        # so jump straight to the next line starting with ">" or (after blanks) "$"
+        if molfile:
+            molfile = False
+            if not in_prop:
+                lo = pos - 1  # the title line's newline
+                if next_gt != -1 and next_gt < lo:
+                    next_gt = buf.find(b"\n>", lo)
+                if next_dollar != -1 and next_dollar < lo:
+                    next_dollar = _find_dollar_line(buf, lo)
+                nxt = [p for p in (next_gt, next_dollar) if p >= 0]
+                if not nxt:
+                    break
+                pos = min(nxt) + 1
+
+        nl = buf.find(b"\n", pos)
+        if nl >= 0:
+            end = nl + 1
+        elif eof:
+            end = n  # last line without trailing newline
+        else:
+            break  # partial line: belongs to the next buffer
+        start, pos = pos, end
+
+        # First line of record (title); for compound files it is often the CID
+        if not title_seen:
+            title_seen = True
+            molfile = True
+            if compound:
+                t = _digits_value(buf[start:end].strip())
+                if t >= 0:
+                    cid = t
+
+        # Property header line: > <FIELDNAME>
+        if buf.find(b"> <", start, start + 3) == start:
+            line_stripped = buf[start:end].rstrip()
+            if line_stripped.endswith(b">"):
+                cid, parent, c_off, c_len = _finalize_py(
+                    cur_mask, val_start, val, cid, parent, c_off, c_len
+                )
+                # Extract between "<" and ">" by slicing (no regex)
+                name = line_stripped[3 : line_stripped.index(b">", 3)]
+                if name:
+                    # few distinct raw names per file: normalize each one once
+                    cur_mask = name_masks.get(name)
+                    if cur_mask is None:
+                        fn = name.decode("utf-8", errors="replace").strip().upper()
+                        cur_mask = name_masks[name] = kinds.get(fn, 0)
+                    in_prop = True
+                else:
+                    cur_mask = 0
+                    in_prop = False
+                val_start = -1
+                continue
+
+        # Property value ends at blank line; first non-blank line is the value
+        if in_prop:
+            line = buf[start:end]
+            line_stripped = line.strip()
+            if not line_stripped:
+                cid, parent, c_off, c_len = _finalize_py(
+                    cur_mask, val_start, val, cid, parent, c_off, c_len
+                )
+                cur_mask = 0
+                val_start = -1
+                in_prop = False
+            elif val_start < 0:
+                val = line_stripped
+                val_start = start + len(line) - len(line.lstrip())
+
+        # Record terminator
+        if buf.find(b"$$$$", start, end) >= 0 and buf[start:end].strip() == b"$$$$":
+            cid, parent, c_off, c_len = _finalize_py(
+                cur_mask, val_start, val, cid, parent, c_off, c_len
+            )
+            starts.append(rec_start)
+            ends.append(end)
+            cids.append(cid)
+            parents.append(parent)
+            c_offs.append(c_off)
+            c_lens.append(c_len)
+
+            # reset record state
+            rec_start = end
+            title_seen = False
+            molfile = False
+            in_prop = False
+            cur_mask = 0
+            val_start = -1
+            cid = parent = c_off = -1
+            c_len = 0
+
+    cols = (starts, ends, cids, parents, c_offs, c_lens)
+    return np.array(cols, dtype=np.int64).reshape(6, -1).T, rec_start
+
+
+def scan_records(buf, table: FieldTable, compound: bool, eof: bool = True) -> ScanResult:
+    """
+    Scan `buf` (bytes-like, starting at a record boundary) for complete records.
+
+    :param compound: compound file: a numeric title line is taken as the CID
+    :param eof: `buf` ends at end of file, so a final line without newline still counts;
+        otherwise the trailing partial line is left for the next call (see `consumed`)
+    """
+    kernel = _scan_kernel_c if _lib is not None else _scan_kernel_jit
+    if kernel is not None:
+        arr = np.frombuffer(buf, dtype=np.uint8)
+        out = np.empty((SCAN_BATCH, 6), dtype=np.int64)
+        parts = []
+        consumed = 0
+        while True:
+            count, consumed = kernel(
+                arr, consumed, eof, compound,
+                table.hashes, table.masks, table.names, table.offsets, out,
+            )
+            parts.append(out[:count].copy())
+            if count < SCAN_BATCH:
+                break
+        rows = np.concatenate(parts) if len(parts) > 1 else parts[0]
+    else:
+        rows, consumed = _scan_py(buf, eof, compound, table.kinds)
+    return ScanResult(*rows.T, consumed=int(consumed))
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+cffi build script for the optional C scanner (_sdf_scan_c.c).
+
+    python -m nih.pubchem.index._sdf_scan_build
+
+compiles it into nih/pubchem/index/_sdf_scan_cffi.*.so; _sdf_scan picks it up when
+importable and otherwise falls back to numba / Python.
+"""
+import shutil
+import tempfile
+from pathlib import Path
+
+from cffi import FFI
+
+HERE = Path(__file__).resolve().parent
+
+CDEF = """
+int64_t sdf_scan(const uint8_t *buf, int64_t n, int64_t pos, int eof, int compound,
+                 const int64_t *f_hash, const int64_t *f_mask, const uint8_t *f_names,
+                 const int64_t *f_off, int64_t n_fields,
+                 int64_t *out, int64_t cap, int64_t *consumed);
+"""
+
+ffibuilder = FFI()
+ffibuilder.cdef(CDEF)
+ffibuilder.set_source(
+    "_sdf_scan_cffi",
+    '#include "_sdf_scan_c.c"',
+    include_dirs=[str(HERE)],
+    extra_compile_args=["-O3"],
+)
+
+
+def build() -> Path:
+    # build out of tree (cffi writes its own .c / .o files), keep only the extension
+    with tempfile.TemporaryDirectory() as tmp:
+        so = Path(ffibuilder.compile(tmpdir=tmp))
+        dest = HERE / so.name
+        shutil.copy2(so, dest)
+    return dest
+
+
+if __name__ == "__main__":
+    print(build())
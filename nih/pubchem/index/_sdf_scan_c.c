@@ -0,0 +1,210 @@
+/*
+ * C version of _sdf_scan._scan_kernel (same state machine, same output layout).
+ * Built with cffi by _sdf_scan_build.py; lines are found with memchr.
+ */
+#include <stdint.h>
+#include <string.h>
+
+#define FIELD_CID 1
+#define FIELD_PARENT_CID 2
+#define FIELD_CONFID 4
+#define MAX_CID_DIGITS 18
+#define HASH_MUL 131
+#define HASH_MASK ((((int64_t)1) << 48) - 1)
+
+/* bytes.strip() whitespace */
+static inline int is_ws(uint8_t c) { return c == 32 || (c >= 9 && c <= 13); }
+
+/* str.strip() (as in _norm_field_name) also removes the \x1c-\x1f separators */
+static inline int is_name_ws(uint8_t c) { return is_ws(c) || (c >= 28 && c <= 31); }
+
+static inline uint8_t ascii_upper(uint8_t c) { return (c >= 97 && c <= 122) ? c - 32 : c; }
+
+static int is_digits(const uint8_t *buf, int64_t a, int64_t b)
+{
+    if (a >= b || b - a > MAX_CID_DIGITS)
+        return 0;
+    for (int64_t i = a; i < b; i++)
+        if (buf[i] < '0' || buf[i] > '9')
+            return 0;
+    return 1;
+}
+
+static int64_t parse_int(const uint8_t *buf, int64_t a, int64_t b)
+{
+    int64_t v = 0;
+    for (int64_t i = a; i < b; i++)
+        v = v * 10 + (buf[i] - '0');
+    return v;
+}
+
+static int64_t field_mask(const uint8_t *buf, int64_t a, int64_t b,
+                          const int64_t *f_hash, const int64_t *f_mask,
+                          const uint8_t *f_names, const int64_t *f_off, int64_t n_fields)
+{
+    /* normalize like _norm_field_name (ASCII): strip, then upper-case on the fly */
+    while (a < b && is_name_ws(buf[a]))
+        a++;
+    while (b > a && is_name_ws(buf[b - 1]))
+        b--;
+    int64_t h = 0;
+    for (int64_t i = a; i < b; i++)
+        h = (h * HASH_MUL + ascii_upper(buf[i])) & HASH_MASK;
+    for (int64_t k = 0; k < n_fields; k++) {
+        if (f_hash[k] != h || f_off[k + 1] - f_off[k] != b - a)
+            continue;
+        const uint8_t *name = f_names + f_off[k];
+        int64_t i = a;
+        while (i < b && ascii_upper(buf[i]) == name[i - a])
+            i++;
+        if (i == b)
+            return f_mask[k];
+    }
+    return 0;
+}
+
+typedef struct {
+    int64_t cid, parent, c_off, c_len;
+} RecordIds;
+
+/* apply the pending field: value is buf[vs:ve] (first non-blank line, stripped) */
+static void finalize(const uint8_t *buf, int64_t mask, int have_val, int64_t vs, int64_t ve,
+                     RecordIds *r)
+{
+    if (!mask || !have_val)
+        return;
+    if (is_digits(buf, vs, ve)) {
+        if ((mask & FIELD_CID) && r->cid < 0)
+            r->cid = parse_int(buf, vs, ve);
+        if ((mask & FIELD_PARENT_CID) && r->parent < 0)
+            r->parent = parse_int(buf, vs, ve);
+    }
+    if ((mask & FIELD_CONFID) && r->c_off < 0) {
+        r->c_off = vs;
+        r->c_len = ve - vs;
+    }
+}
+
+/*
+ * Scan buf[pos:n] into out[i * 6 ..] = (start, end, cid, parent_cid, confid_off, confid_len).
+ * Returns the record count and stores the resume offset in *consumed; a count of cap means
+ * out is full and the scan should be resumed at *consumed.
+ */
+int64_t sdf_scan(const uint8_t *buf, int64_t n, int64_t pos, int eof, int compound,
+                 const int64_t *f_hash, const int64_t *f_mask, const uint8_t *f_names,
+                 const int64_t *f_off, int64_t n_fields,
+                 int64_t *out, int64_t cap, int64_t *consumed)
+{
+    int64_t count = 0;
+    int64_t rec_start = pos;
+    int title_seen = 0, in_prop = 0, have_val = 0, molfile = 0;
+    int64_t cur_mask = 0, vs = 0, ve = 0;
+    RecordIds r = {-1, -1, -1, 0};
+
+    while (pos < n && count < cap) {
+        /* Molfile block (up to M  END): only a "> <" or $$$$ line can change state */
+        if (molfile) {
+            molfile = 0;
+            if (!in_prop) {
+                /* stop at a line starting with '>', or with '$' after leading blanks */
+                while (pos < n && buf[pos] != '>') {
+                    int64_t q = pos;
+                    while (q < n && buf[q] != '\n' && is_ws(buf[q]))
+                        q++;
+                    if (q < n && buf[q] == '$')
+                        break;
+                    const uint8_t *nl = memchr(buf + q, '\n', (size_t)(n - q));
+                    pos = nl ? (int64_t)(nl - buf) + 1 : n;
+                }
+                if (pos >= n)
+                    break;
+            }
+        }
+
+        int64_t end;
+        const uint8_t *nl = memchr(buf + pos, '\n', (size_t)(n - pos));
+        if (nl)
+            end = (int64_t)(nl - buf) + 1;
+        else if (eof)
+            end = n; /* last line without trailing newline */
+        else
+            break; /* partial line: belongs to the next buffer */
+        int64_t start = pos;
+        pos = end;
+
+        /* line with surrounding whitespace stripped: [a, b) */
+        int64_t a = start, b = end;
+        while (a < b && is_ws(buf[a]))
+            a++;
+        while (b > a && is_ws(buf[b - 1]))
+            b--;
+
+        /* First line of record (title); for compound files it is often the CID */
+        if (!title_seen) {
+            title_seen = 1;
+            molfile = 1;
+            if (compound && is_digits(buf, a, b))
+                r.cid = parse_int(buf, a, b);
+        }
+
+        /* Property header line: > <FIELDNAME> */
+        if (b > start + 3 && buf[start] == '>' && buf[start + 1] == ' ' && buf[start + 2] == '<'
+            && buf[b - 1] == '>') {
+            finalize(buf, cur_mask, have_val, vs, ve, &r);
+            /* field name: between "> <" and the next ">" */
+            int64_t q = start + 3;
+            while (buf[q] != '>')
+                q++;
+            if (q > start + 3) {
+                cur_mask = field_mask(buf, start + 3, q, f_hash, f_mask, f_names, f_off, n_fields);
+                in_prop = 1;
+            } else {
+                cur_mask = 0;
+                in_prop = 0;
+            }
+            have_val = 0;
+            continue;
+        }
+
+        /* Property value ends at blank line; first non-blank line is the value */
+        if (in_prop) {
+            if (a == b) {
+                finalize(buf, cur_mask, have_val, vs, ve, &r);
+                cur_mask = 0;
+                have_val = 0;
+                in_prop = 0;
+            } else if (!have_val) {
+                have_val = 1;
+                vs = a;
+                ve = b;
+            }
+        }
+
+        /* Record terminator */
+        if (b - a == 4 && buf[a] == '$' && buf[a + 1] == '$' && buf[a + 2] == '$'
+            && buf[a + 3] == '$') {
+            finalize(buf, cur_mask, have_val, vs, ve, &r);
+            int64_t *row = out + count * 6;
+            row[0] = rec_start;
+            row[1] = end;
+            row[2] = r.cid;
+            row[3] = r.parent;
+            row[4] = r.c_off;
+            row[5] = r.c_len;
+            count++;
+
+            /* reset record state */
+            rec_start = end;
+            title_seen = 0;
+            molfile = 0;
+            in_prop = 0;
+            cur_mask = 0;
+            have_val = 0;
+            r.cid = r.parent = r.c_off = -1;
+            r.c_len = 0;
+        }
+    }
+
+    *consumed = rec_start;
+    return count;
+}
@@ -1,11 +1,35 @@
+import os
 from pathlib import Path
-from ailingues_core.utils.archive_io import ArchiveIO, ArchiveType
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from rich.progress import Progress, SpinnerColumn, BarColumn, TextColumn, TimeElapsedColumn
 from utils.files import get_files_by_extension
+from utils.gzip_io import backend_available, build_gzip_index, gunzip
 from utils.md5_check import verify_md5
 
 
+# 小文件的解压后端: "isal" | "libdeflate" | "stdlib", None 表示安装了 isal 时用 isal 否则 stdlib
+GZIP_BACKEND = None
+# 不小于该大小的 .gz 逐个用 pigz 多线程解压 (未安装 pigz 时用 GZIP_BACKEND), 其余小文件用进程池并行解压
+LARGE_FILE_SIZE = 256 * 1024 * 1024
+# 同时生成 <name>.gz.gzi 随机访问索引, 使 SDFIndex.read_segment_gz 可直接读取 .gz
+BUILD_GZI = False
+
+
+def _extract_one(sdf_file: str, input_dir: Path, backend: str):
+    """
+    解压单个 .gz 并校验 md5 (运行在子进程中, 或对大文件在主进程中)
+    返回: (sdf_file, md5 校验结果; 无 .md5 文件时为 None)
+    """
+    gunzip(sdf_file, input_dir, overwrite=True, backend=backend)
+    if BUILD_GZI:
+        build_gzip_index(sdf_file)
+    md5_file = Path(f"{str(sdf_file)}.md5")
+    if not md5_file.exists():
+        return sdf_file, None
+    return sdf_file, verify_md5(sdf_file, md5_file)
+
+
 if __name__=="__main__":
     input_dir = Path('./nih/pubchem/index/test_index')
     sdf_files=get_files_by_extension(str(input_dir),extension='.gz')
@@ -17,19 +41,32 @@ if __name__=="__main__":
         TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
         TimeElapsedColumn(),
     ]
+    large_files = [f for f in sdf_files if os.path.getsize(f) >= LARGE_FILE_SIZE]
+    small_files = [f for f in sdf_files if os.path.getsize(f) < LARGE_FILE_SIZE]
     with Progress(*progress_columns) as progress:
         task_id = progress.add_task("Extracting...", total=len(sdf_files))
-        for idx,sdf_file in enumerate(sdf_files):
-            progress.update(task_id, description=f"Extracting {Path(sdf_file).name}")
-            dest = ArchiveIO.extract(archive=sdf_file, dest_dir=input_dir,overwrite=True)
-            md5_file = Path(f"{str(sdf_file)}.md5")
-            if md5_file.exists():
-                result=verify_md5(sdf_file,md5_file)
+
+        def report(idx, sdf_file, result):
+            progress.update(task_id, description=f"Extracted {Path(sdf_file).name}")
+            if result is not None:
                 if not result:
                     failed_md5_file_list.append(sdf_file)
                 print(f"{idx}:\t{result}{'✅' if result else '❌'}:\t {Path(sdf_file).name}")
-            
             progress.update(task_id, advance=1)
 
+        # 大文件: 一次一个, pigz 占满所有核
+        large_backend = "pigz" if backend_available("pigz") else GZIP_BACKEND
+        for idx, sdf_file in enumerate(large_files):
+            report(idx, *_extract_one(sdf_file, input_dir, large_backend))
+
+        # 小文件: gzip 解压是 CPU 密集型且文件之间相互独立, 每个文件交给一个子进程
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            futures = [
+                executor.submit(_extract_one, sdf_file, input_dir, GZIP_BACKEND)
+                for sdf_file in small_files
+            ]
+            for idx, future in enumerate(as_completed(futures), start=len(large_files)):
+                report(idx, *future.result())
+
     print('finished')
     
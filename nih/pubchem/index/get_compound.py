@@ -1,50 +1,128 @@
+import os
 import json
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, List
-from pybiotech.loaders.nih.pubchem.online.conformer import get_compound_conformer_ids
-from nih.pubchem.index.sdf_index import SDFIndex
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from nih.pubchem.index.sdf_index import IndexHit, SDFIndex
+
+
+# Max buffers per writev call (Linux IOV_MAX)
+IOV_MAX = 1024
+
+# Max read-only indexes kept open by _open_index (LRU; the evicted one is closed)
+INDEX_CACHE_SIZE = 4
+_index_cache: "OrderedDict[str, SDFIndex]" = OrderedDict()
+
+
+def _open_index(index_path: str) -> SDFIndex:
+    """
+    One read-only env per index path per process: reopening re-maps the env and
+    opens the named DBs again, and two envs on the same path share one reader table.
+    Evicting an index closes its env, file handles and mappings; callers that hold on
+    to an index across many paths should open and pass their own SDFIndex.
+    """
+    idx = _index_cache.get(index_path)
+    if idx is not None:
+        _index_cache.move_to_end(index_path)
+        return idx
+    idx = SDFIndex(index_path, readonly=True)
+    _index_cache[index_path] = idx
+    if len(_index_cache) > INDEX_CACHE_SIZE:
+        _, oldest = _index_cache.popitem(last=False)
+        oldest.close()
+    return idx
+
+
+def close_indexes() -> None:
+    """Close every index opened by path through this module."""
+    while _index_cache:
+        _index_cache.popitem()[1].close()
+
+
+def _get_index(index: str | SDFIndex) -> SDFIndex:
+    return index if isinstance(index, SDFIndex) else _open_index(str(index))
+
+
+def _read_segments_sorted(
+        idx: SDFIndex,
+        root_path: str,
+        hits: List[Tuple[Any, Optional[IndexHit]]],
+) -> Dict[Any, bytes]:
+    """
+    Read segments in (file_id, start) order so the disk sees sequential reads,
+    regardless of the order keys were requested in; readahead for all of them is
+    requested up front (SDFIndex.advise_segments).
+    """
+    found = sorted(
+        (t for t in hits if t[1]),
+        key=lambda t: (t[1].locator.file_id, t[1].locator.start),
+    )
+    idx.advise_segments(root_path, [hit.locator for _, hit in found])
+    return {key: idx.read_segment(root_path, hit.locator) for key, hit in found}
 
 
 def get_compound(
         cid_list: List[str | int],
-        index_path: str,
+        index_path: str | SDFIndex,
         root_path: str,
-) -> Dict[str, str]:
-    idx = SDFIndex(index_path, readonly=True)
+) -> Dict[str, bytes]:
+    idx = _get_index(index_path)
     cids: List[int] = [int(cid) for cid in cid_list]
-    sdf_content_dict: Dict[str, str] = {}
-    for id, cid in enumerate(cids):
-        hit = idx.get_compound_by_cid(cid)
+    hits = [(cid, idx.get_compound_by_cid(cid)) for cid in cids]
+    segments = _read_segments_sorted(idx, root_path, hits)
+    sdf_content_dict: Dict[str, bytes] = {}
+    for cid, hit in hits:
         if not hit:
             print("NOT FOUND")
         else:
-            seg_compound = idx.read_segment(root_path, hit.locator)
-            sdf_content_dict[str(hit.locator.cid)]=seg_compound.decode("utf-8", errors="replace")
+            sdf_content_dict[str(hit.locator.cid)]=segments[cid]
     
     return sdf_content_dict
 
 
 
-def get_conformer(index_path: str, root_path: str, confid_list: List[str]) -> None | str:
+def get_conformer(index_path: str | SDFIndex, root_path: str, confid_list: List[str]) -> Dict[str, Optional[bytes]]:
 
-    idx = SDFIndex(index_path, readonly=True)
-    conformer_dict={}
-    for confid in confid_list:
-        hit = idx.get_conformer_by_conformer_id(confid)
+    idx = _get_index(index_path)
+    hits = [(confid, idx.get_conformer_by_conformer_id(confid)) for confid in confid_list]
+    segments = _read_segments_sorted(idx, root_path, hits)
+    conformer_dict: Dict[str, Optional[bytes]] = {}
+    for confid, hit in hits:
         if not hit:
             print("NOT FOUND")
             conformer_dict[confid] = None
         else:
-            seg = idx.read_segment(root_path, hit.locator)
-            conformer_dict[confid] = seg.decode("utf-8", errors="replace")
+            conformer_dict[confid] = segments[confid]
 
     return conformer_dict
 
 
+def write_segments(path: str | Path, segments: Iterable[bytes]) -> int:
+    """
+    Write raw SDF segments back to back with os.writev (IOV_MAX buffers per syscall).
+    Returns the number of non-empty segments written.
+    """
+    segs = [seg for seg in segments if seg]
+    with open(path, "wb", buffering=0) as f:
+        fd = f.fileno()
+        for i in range(0, len(segs), IOV_MAX):
+            group = segs[i : i + IOV_MAX]
+            written = os.writev(fd, group)
+            want = sum(len(seg) for seg in group)
+            if written < want:
+                # short write: finish the remainder of this group
+                rest = memoryview(b"".join(group))[written:]
+                while rest:
+                    rest = rest[os.write(fd, rest):]
+    return len(segs)
+
+
 # -----------------------------
 # Example usage
 # -----------------------------
 if __name__ == "__main__":
+    from pybiotech.loaders.nih.pubchem.online.conformer import get_compound_conformer_ids
+
     cid_list: List[str] = []
 
     compound_index_path = '/ai/data/pubchem_unzipped_data/compound'
@@ -59,13 +137,8 @@ if __name__ == "__main__":
     
     # 1：获取分子数据
     sdf_content_dict = get_compound(cid_list, compound_index_path, compound_root_path)
-    with open('test/nih/pubchem/index/test_compound.sdf', 'w', encoding='utf-8') as f:
-        i=0
-        for key,value in sdf_content_dict.items():
-            f.write(value)
-            i+=1
-        f.flush()
-        print(f"compound count:\t{i}")
+    i = write_segments('test/nih/pubchem/index/test_compound.sdf', sdf_content_dict.values())
+    print(f"compound count:\t{i}")
     
     # 2. 获取并处理compound与conformer的关联关系
     
@@ -91,14 +164,9 @@ if __name__ == "__main__":
             
     conformer_data = get_conformer(index_path=conformer_index_path,root_path=conformer_root_path,confid_list=confid_list)
 
-    with open('test/nih/pubchem/index/test_conformer.sdf', 'w', encoding='utf-8') as f:
-        i=0
-        for key,value in conformer_data.items():  
-            if value is None or len(value)==0:
-                print(key)   
-                continue       
-            f.write(value)
-            i+=1
-        f.flush()
-        print(f"conformer count:\t{i}")
+    for key,value in conformer_data.items():
+        if value is None or len(value)==0:
+            print(key)
+    i = write_segments('test/nih/pubchem/index/test_conformer.sdf', conformer_data.values())
+    print(f"conformer count:\t{i}")
     print('done.')
@@ -15,7 +15,7 @@
 # - Index all .sdf files under a directory
 # - Distinguish compound vs conformer by filename patterns (configurable)
 # - Build byte-offset locator per record: file_id + start/end offsets
-# - Generate deterministic ALID (UUIDv5) stored in index
+# - Deterministic ALID derived from the record key (CID / file_id + rec_no)
 # - Fast lookup:
 #     CID -> compound record (0/1)
 #     conformer_id -> conformer record (0/1)
@@ -27,14 +27,18 @@
 #   pip install lmdb
 # Optional:
 #   pip install tqdm
+#   pip install numba   (JIT-compiled SDF scanner for build)
+#   python -m nih.pubchem.index._sdf_scan_build   (C SDF scanner via cffi, preferred over numba)
 
 from __future__ import annotations
 
+import sys
 import json
 from pathlib import Path
-from typing import Dict, Union
+from typing import Dict, Optional, Union
 from nih.pubchem.index.sdf_index import SDFIndex
 from nih.pubchem.index.sdf_index_builder import SDFIndexBuilder
+from nih.pubchem.index.migrate import migrate_index
 
 # -----------------------------
 # CLI helpers (optional)
@@ -46,12 +50,14 @@ def build_index(
     index_dir: Union[str, Path],
     map_size: int = 1 << 40,
     verbose: bool = True,
+    workers: Optional[int] = None,
 ) -> Dict:
     builder = SDFIndexBuilder(
         root_dir=root_dir,
         index_dir=index_dir,
         map_size=map_size,
         verbose=verbose,
+        workers=workers,
     )
     return builder.build()
 
@@ -83,6 +89,18 @@ if __name__ == "__main__":
     p_build.add_argument(
         "--quiet", action="store_true", help="Disable progress output."
     )
+    p_build.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes scanning SDF files in parallel (default: CPU count).",
+    )
+
+    p_mig = sub.add_parser(
+        "migrate", help="Upgrade an existing index to the current schema in place."
+    )
+    p_mig.add_argument("--index", required=True)
+    p_mig.add_argument("--map-size", type=int, default=(1 << 40))
 
     p_q1 = sub.add_parser("get-compound", help="Get compound record by CID.")
     p_q1.add_argument("--root", required=True)
@@ -106,10 +124,23 @@ if __name__ == "__main__":
 
     if args.cmd == "build":
         meta = build_index(
-            args.root, args.index, map_size=args.map_size, verbose=not args.quiet
+            args.root,
+            args.index,
+            map_size=args.map_size,
+            verbose=not args.quiet,
+            workers=args.workers,
         )
         print(json.dumps(meta, ensure_ascii=False, indent=2))
 
+    elif args.cmd == "migrate":
+        version = migrate_index(args.index, map_size=args.map_size)
+        print(f"schema_version={version}")
+        idx = SDFIndex(args.index, readonly=True)
+        dropped = idx.get_meta().get("duplicate_cid_records_dropped")
+        idx.close()
+        if dropped:
+            print(f"{dropped} compound records dropped: a later record has the same CID")
+
     elif args.cmd == "get-compound":
         idx = SDFIndex(args.index, readonly=True)
         hit = idx.get_compound_by_cid(args.cid)
@@ -121,7 +152,8 @@ if __name__ == "__main__":
             print(
                 f"file_id={hit.locator.file_id} start={hit.locator.start} end={hit.locator.end} cid={hit.locator.cid}"
             )
-            print(seg[:4000].decode("utf-8", errors="replace"))
+            sys.stdout.flush()
+            sys.stdout.buffer.write(seg[:4000])
 
     elif args.cmd == "get-conformer":
         idx = SDFIndex(args.index, readonly=True)
@@ -134,7 +166,8 @@ if __name__ == "__main__":
             print(
                 f"file_id={hit.locator.file_id} start={hit.locator.start} end={hit.locator.end} cid={hit.locator.cid}"
             )
-            print(seg[:4000].decode("utf-8", errors="replace"))
+            sys.stdout.flush()
+            sys.stdout.buffer.write(seg[:4000])
 
     elif args.cmd == "list-conformers":
         idx = SDFIndex(args.index, readonly=True)
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+In-place upgrade of an existing LMDB index to SDFIndex.SCHEMA_VERSION.
+
+Steps walk their tables in batches of MIGRATE_BATCH entries, one write txn per batch,
+so memory use and dirty pages stay bounded on full PubChem indexes. The position
+reached (phase + last key) is committed with each batch under meta_json["migration"];
+an interrupted migration resumes from there when migrate_index is run again.
+"""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import lmdb
+
+from nih.pubchem.index.record_locator import OFFSETS_STRUCT, RECORD_STRUCT
+from nih.pubchem.index.utils_module import (
+    _cid_key,
+    _file_id_key,
+    _make_record_id,
+    _pl_page_key,
+)
+
+# Entries handled per write txn
+MIGRATE_BATCH = 100_000
+
+# Scratch tables of a running step (dropped when the step finishes)
+_ORDER_DB = b"_migrate_order"
+_COMPOUNDS_DB = b"_migrate_compounds"
+
+
+def _batch(
+    txn: lmdb.Transaction,
+    db,
+    state: Dict,
+    prefix: bytes = b"",
+    start: Optional[bytes] = None,
+) -> List[Tuple[bytes, bytes]]:
+    """
+    Next MIGRATE_BATCH (key, value) pairs of `db` with keys starting with `prefix`,
+    from `start` (default: prefix) or after the key in state["after"], which is
+    advanced. Entries behind the marker may be deleted or rewritten meanwhile.
+    """
+    after = bytes.fromhex(state["after"]) if "after" in state else None
+    cur = txn.cursor(db=db)
+    items: List[Tuple[bytes, bytes]] = []
+    if cur.set_range(after if after is not None else (start or prefix)):
+        for k, v in cur:
+            if k == after:
+                continue
+            if not k.startswith(prefix) or len(items) == MIGRATE_BATCH:
+                break
+            items.append((k, v))
+    if items:
+        state["after"] = items[-1][0].hex()
+    return items
+
+
+def _advance(state: Dict, items: List) -> None:
+    """Move on to the next phase once a batch came back short (the table is done)."""
+    if len(items) < MIGRATE_BATCH:
+        state.pop("after", None)
+        state["phase"] = state.get("phase", 0) + 1
+
+
+def _rewrite_values_batch(
+    txn: lmdb.Transaction, db, state: Dict, convert: Callable[[bytes], Optional[bytes]]
+) -> None:
+    """One batch of `db` values through `convert` (None deletes the entry)."""
+    items = _batch(txn, db, state)
+    for k, v in items:
+        new = convert(v)
+        if new is None:
+            txn.delete(k, db=db)
+        else:
+            txn.put(k, new, db=db)
+    _advance(state, items)
+
+
+def _v1_to_v2(env: lmdb.Environment, txn: lmdb.Transaction, state: Dict) -> bool:
+    """
+    CID keys: ascii decimal -> uint64 big-endian; page keys: b"cid|page" -> cid + uint32.
+    Rewritten in place: converted keys start with a zero byte, so they sort before the
+    ascii keys ("0".."9") still to do.
+    """
+    ascii_cid = lambda k: _cid_key(int(k))
+
+    def page_key(k: bytes) -> bytes:
+        cid, page_no = k.split(b"|")
+        return _pl_page_key(_cid_key(int(cid)), int(page_no))
+
+    phases = [
+        (b"cid_to_compound", ascii_cid),
+        (b"cid_to_conformers_h", ascii_cid),
+        (b"cid_to_conformers_p", page_key),
+    ]
+    name, convert = phases[state.get("phase", 0)]
+    db = env.open_db(name, txn=txn)
+    items = _batch(txn, db, state, start=b"0")
+    for k, v in items:
+        txn.delete(k, db=db)
+        txn.put(convert(k), v, db=db)
+    _advance(state, items)
+    return state.get("phase", 0) == len(phases)
+
+
+def _v2_to_v3(env: lmdb.Environment, txn: lmdb.Transaction, state: Dict) -> bool:
+    """
+    `files` table: little-endian byte keys -> MDB_INTEGERKEY (native size_t).
+    One row per SDF file, so the table is rewritten in a single txn.
+    """
+    old = env.open_db(b"files", txn=txn)
+    items = [(int.from_bytes(k, "little"), v) for k, v in txn.cursor(db=old)]
+    # DB flags are fixed at creation: delete and recreate with integerkey
+    txn.drop(old, delete=True)
+    new = env.open_db(b"files", txn=txn, integerkey=True)
+    for file_id, v in items:
+        txn.put(_file_id_key(file_id), v, db=new)
+    return True
+
+
+def _v3_to_v4(env: lmdb.Environment, txn: lmdb.Transaction, state: Dict) -> bool:
+    """
+    `records` keys: prefix + alid16 -> prefix + file_id + rec_no; the ALID moves into the
+    value and gets its own `alid_to_record` table. Secondary values and posting-list
+    entries follow the new keys.
+
+    Phases: 0 copy (file_id, start) -> old key into a scratch table, so old keys can be
+    visited in file order; 1 re-key the records in that order (rec_no is the rank by
+    start offset within the file); 2-4 rewrite cid_to_compound, confid_to_conf and the
+    posting pages through alid_to_record; 5 drop the scratch table.
+    """
+    db_records = env.open_db(b"records", txn=txn)
+    db_order = env.open_db(_ORDER_DB, txn=txn)
+    db_alid = env.open_db(b"alid_to_record", txn=txn)
+    phase = state.get("phase", 0)
+
+    if phase == 0:
+        items = _batch(txn, db_records, state)
+        for k, v in items:
+            file_id, start = OFFSETS_STRUCT.unpack_from(v)[:2]
+            order_k = file_id.to_bytes(4, "big") + start.to_bytes(8, "big")
+            txn.put(order_k, k, db=db_order)
+        _advance(state, items)
+
+    elif phase == 1:
+        items = _batch(txn, db_order, state)
+        for order_k, old_k in items:
+            file_id = int.from_bytes(order_k[:4], "big")
+            if state.get("file_id") != file_id:
+                state["file_id"], state["rec_no"] = file_id, 0
+            new_k = old_k[:1] + _make_record_id(file_id, state["rec_no"])
+            state["rec_no"] += 1
+            v = txn.get(old_k, db=db_records)
+            # old keys are 17 bytes, new ones 9: both coexist until the phase ends
+            txn.delete(old_k, db=db_records)
+            txn.put(new_k, v + old_k[1:17], db=db_records)
+            txn.put(old_k[1:17], new_k, db=db_alid)
+        _advance(state, items)
+        if state["phase"] != 1:
+            state.pop("file_id", None)
+            state.pop("rec_no", None)
+
+    elif phase in (2, 3):
+        name = b"cid_to_compound" if phase == 2 else b"confid_to_conf"
+        _rewrite_values_batch(
+            txn, env.open_db(name, txn=txn), state, lambda v: txn.get(v[1:17], db=db_alid)
+        )
+
+    elif phase == 4:
+
+        def page(blob: bytes) -> bytes:
+            new_keys = (txn.get(blob[i : i + 16], db=db_alid) for i in range(0, len(blob), 16))
+            return b"".join(k[1:] for k in new_keys if k is not None)
+
+        _rewrite_values_batch(txn, env.open_db(b"cid_to_conformers_p", txn=txn), state, page)
+
+    else:
+        txn.drop(db_order, delete=True)
+        return True
+    return False
+
+
+def _v4_to_v5(env: lmdb.Environment, txn: lmdb.Transaction, state: Dict) -> bool:
+    """
+    Compound `records` keys: b"C" + record_id -> b"C" + cid for the record
+    `cid_to_compound` pointed at (the last one built for that CID), b"N" + record_id
+    for compounds without a CID; other compounds with a CID were duplicates and are
+    dropped, as the builder does (counted in state["dropped"]). `cid_to_compound` is
+    dropped.
+
+    Phases: 0 move compound records into a scratch table (old and new C keys would
+    collide); 1 re-key the cid_to_compound targets; 2 re-key the remaining compounds
+    without a CID, drop the rest; 3 drop cid_to_compound and the scratch table.
+    """
+    db_records = env.open_db(b"records", txn=txn)
+    db_alid = env.open_db(b"alid_to_record", txn=txn)
+    db_cid = env.open_db(b"cid_to_compound", txn=txn)
+    db_tmp = env.open_db(_COMPOUNDS_DB, txn=txn)
+    phase = state.get("phase", 0)
+
+    if phase == 0:
+        items = _batch(txn, db_records, state, prefix=b"C")
+        for k, v in items:
+            txn.put(k[1:], v, db=db_tmp)
+            txn.delete(k, db=db_records)
+        _advance(state, items)
+
+    elif phase == 1:
+        items = _batch(txn, db_cid, state)
+        for cid_k, rec_key in items:
+            v = txn.pop(rec_key[1:], db=db_tmp)
+            if v is not None:
+                txn.put(b"C" + cid_k, v, db=db_records)
+                txn.put(v[RECORD_STRUCT.size :], b"C" + cid_k, db=db_alid)
+        _advance(state, items)
+
+    elif phase == 2:
+        # every entry is removed from the scratch table: no marker needed
+        state.pop("after", None)
+        items = _batch(txn, db_tmp, state)
+        for rec_id, v in items:
+            txn.delete(rec_id, db=db_tmp)
+            if RECORD_STRUCT.unpack_from(v)[4] == -1:
+                txn.put(b"N" + rec_id, v, db=db_records)
+                txn.put(v[RECORD_STRUCT.size :], b"N" + rec_id, db=db_alid)
+            else:
+                txn.delete(v[RECORD_STRUCT.size :], db=db_alid)
+                state["dropped"] = state.get("dropped", 0) + 1
+        _advance(state, items)
+
+    else:
+        txn.drop(db_cid, delete=True)
+        txn.drop(db_tmp, delete=True)
+        return True
+    return False
+
+
+def _v5_to_v6(env: lmdb.Environment, txn: lmdb.Transaction, state: Dict) -> bool:
+    """
+    ALIDs are now derived from the record key: the alid16 suffix of `records` values and
+    the `alid_to_record` table are dropped. Previously issued (UUIDv5) ALIDs stop resolving.
+    """
+    if state.get("phase", 0) == 0:
+        _rewrite_values_batch(
+            txn, env.open_db(b"records", txn=txn), state, lambda v: v[: RECORD_STRUCT.size]
+        )
+        return False
+    txn.drop(env.open_db(b"alid_to_record", txn=txn), delete=True)
+    return True
+
+
+# schema_version -> step; a step handles one batch per call and returns True when done
+MIGRATIONS: Dict[int, Callable[[lmdb.Environment, lmdb.Transaction, Dict], bool]] = {
+    1: _v1_to_v2,
+    2: _v2_to_v3,
+    3: _v3_to_v4,
+    4: _v4_to_v5,
+    5: _v5_to_v6,
+}
+
+
+def _count_dropped(meta: Dict, dropped: int) -> None:
+    """Keep the build stats in meta_json in line with the records a step removed."""
+    if not dropped:
+        return
+    meta["duplicate_cid_records_dropped"] = meta.get("duplicate_cid_records_dropped", 0) + dropped
+    for key in ("total_records", "total_compound_records"):
+        if key in meta:
+            meta[key] -= dropped
+
+
+def migrate_index(index_dir: Union[str, Path], map_size: int = 1 << 40) -> int:
+    """
+    Upgrade the index at `index_dir` step by step to the current schema version, one
+    write transaction per batch (see MIGRATE_BATCH); resumes an interrupted run.
+    Compound records dropped as duplicates are counted in meta_json
+    ("duplicate_cid_records_dropped"). Returns the resulting schema version.
+    """
+    from nih.pubchem.index.sdf_index import SDFIndex
+
+    env = lmdb.open(str(index_dir), map_size=map_size, max_dbs=32, subdir=True, create=False)
+    try:
+        db_meta = env.open_db(b"meta")
+        while True:
+            with env.begin(write=True) as txn:
+                raw = txn.get(b"meta_json", db=db_meta)
+                meta = json.loads(raw.decode("utf-8")) if raw else {}
+                version = meta.get("schema_version", SDFIndex.SCHEMA_VERSION)
+                if version == SDFIndex.SCHEMA_VERSION:
+                    return version
+                if version not in MIGRATIONS:
+                    raise RuntimeError(f"No migration from schema_version={version}")
+                state = meta.get("migration", {})
+                if MIGRATIONS[version](env, txn, state):
+                    meta["schema_version"] = version + 1
+                    meta.pop("migration", None)
+                    _count_dropped(meta, state.get("dropped", 0))
+                else:
+                    meta["migration"] = state
+                txn.put(
+                    b"meta_json",
+                    json.dumps(meta, ensure_ascii=False, sort_keys=True).encode("utf-8"),
+                    db=db_meta,
+                )
+    finally:
+        env.close()
@@ -25,6 +25,10 @@ from typing import Optional
 # reserved: uint16
 # Total: 4 + 8 + 8 + 2 + 8 + 2 = 32 bytes
 RECORD_STRUCT = struct.Struct("<IQQHqH")
+# Leading (file_id, start, end) of RECORD_STRUCT (used by migrate.py to order records)
+OFFSETS_STRUCT = struct.Struct("<IQQ")
+# `records` values are exactly RECORD_STRUCT bytes (the ALID is derived from the key)
+RECORD_VALUE_SIZE = RECORD_STRUCT.size
 
 FLAG_IS_CONFORMER = 0x0001
 
@@ -52,12 +56,12 @@ class RecordLocator:
 
     @staticmethod
     def from_bytes(b: bytes) -> "RecordLocator":
-        file_id, start, end, flags, cid_i64, _ = RECORD_STRUCT.unpack(b)
-        cid = None if cid_i64 == -1 else int(cid_i64)
+        # unpack_from reads the LMDB value (bytes or memoryview) in place
+        file_id, start, end, flags, cid_i64, _ = RECORD_STRUCT.unpack_from(b)
         return RecordLocator(
-            file_id=int(file_id),
-            start=int(start),
-            end=int(end),
+            file_id=file_id,
+            start=start,
+            end=end,
             is_conformer=bool(flags & FLAG_IS_CONFORMER),
-            cid=cid,
+            cid=None if cid_i64 == -1 else cid_i64,
         )
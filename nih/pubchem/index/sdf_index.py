@@ -11,22 +11,91 @@
 **********************************************************"""
 from __future__ import annotations
 
+import io
+import os
+import inspect
 import json
+import mmap
 import uuid
 import lmdb
-from dataclasses import dataclass
+import numpy as np
+from collections import OrderedDict
 from pathlib import Path
-from typing import Iterable, Iterator, Optional, Dict, Tuple, Union
-from nih.pubchem.index.record_locator import RecordLocator
-from nih.pubchem.index.utils_module import _chunked
+from typing import Iterable, Iterator, List, Optional, Dict, Sequence, Tuple, Union
+from nih.pubchem.index.record_locator import RECORD_VALUE_SIZE, RecordLocator
+from nih.pubchem.index.utils_module import (
+    RECORD_ID_SIZE,
+    _alid_from_key,
+    _chunked,
+    _cid_key,
+    _compound_key,
+    _file_id_key,
+    _is_cid,
+    _key_from_alid,
+    _pl_page_key,
+)
+from utils.gzip_io import open_indexed_gzip
+
+try:  # optional, Linux only: batched reads through io_uring
+    import liburing
+except ImportError:
+    liburing = None
+
+
+def _prep_read_takes_nbytes() -> bool:
+    # older Cython bindings: io_uring_prep_read(sqe, fd, buf, nbytes, offset);
+    # current ones: io_uring_prep_read(sqe, fd, buf, offset), nbytes = len(buf)
+    try:
+        return "nbytes" in inspect.signature(liburing.io_uring_prep_read).parameters
+    except (TypeError, ValueError):
+        return True
+
+
+_PREP_READ_TAKES_NBYTES = liburing is not None and _prep_read_takes_nbytes()
+
+# Hot CID cache entry: the `records` value (RecordLocator bytes), fixed stride
+HOT_ENTRY_SIZE = RECORD_VALUE_SIZE
+
+# read_segments_coalesced: max bytes covered by one pread
+COALESCE_MAX_SPAN = 8 << 20
+
+# io_uring submission queue depth and number of reads submitted per round trip
+IO_URING_DEPTH = 256
+IO_URING_BATCH = 32
 
 
-@dataclass(frozen=True)
 class IndexHit:
-    """Resolved record including ALID."""
+    """
+    Resolved record including ALID.
+    Holds the raw 16 ALID bytes (derived from the record key); the UUID object is only
+    built on access.
+    """
+
+    __slots__ = ("alid_bytes", "locator")
+
+    def __init__(self, alid_bytes: bytes, locator: RecordLocator):
+        self.alid_bytes = alid_bytes
+        self.locator = locator
+
+    @classmethod
+    def from_value(cls, rec_key: bytes, b: bytes) -> "IndexHit":
+        """Build from a `records` key and value (RecordLocator bytes)."""
+        return cls(_alid_from_key(bytes(rec_key)), RecordLocator.from_bytes(b))
+
+    @property
+    def alid(self) -> uuid.UUID:
+        return uuid.UUID(bytes=self.alid_bytes)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, IndexHit):
+            return NotImplemented
+        return self.alid_bytes == other.alid_bytes and self.locator == other.locator
+
+    def __hash__(self) -> int:
+        return hash((self.alid_bytes, self.locator))
 
-    alid: uuid.UUID
-    locator: RecordLocator
+    def __repr__(self) -> str:
+        return f"IndexHit(alid={self.alid!r}, locator={self.locator!r})"
 
 
 # -----------------------------
@@ -40,25 +109,51 @@ class SDFIndex:
 
     Databases:
       - meta:              JSON metadata, schema version, root path, etc.
-      - files:             file_id -> relative path (bytes)
+      - files:             file_id (native size_t, MDB_INTEGERKEY) -> relative path (bytes)
       - files_rev:         relative path -> file_id
-      - records:           key = b"C"+uuid16 or b"F"+uuid16 -> RecordLocator bytes
-      - cid_to_compound:   key = cid (ascii bytes) -> record key (b"C"+uuid16)
-      - confid_to_conf:    key = conformer_id (utf-8 bytes) -> record key (b"F"+uuid16)
+      - records:           key = b"C" + cid (uint64 big-endian) for compounds,
+                           b"N" + record_id for compounds without a CID,
+                           b"F" + record_id for conformers
+                           (record_id = file_id||rec_no, uint32 BE each)
+                           -> RecordLocator bytes
+                           ALID = record key left-padded with zero bytes to 16 bytes
+      - confid_to_conf:    key = conformer_id (utf-8 bytes) -> record key (b"F"+record_id)
       - cid_to_conformers_h:  header: key = cid -> page_count (uint32)
-      - cid_to_conformers_p:  pages:  key = cid|page_no -> packed uuid16 list (len multiple of 16)
+      - cid_to_conformers_p:  pages:  key = cid + page_no (uint32 big-endian) -> packed record_id list (len multiple of 8)
     """
 
-    SCHEMA_VERSION = 1
+    SCHEMA_VERSION = 6
+
+    # Max number of SDF file handles / mappings kept open by read_segment (LRU)
+    FD_CACHE_SIZE = 64
+    # Page-cache hint for mapped SDF files; point lookups dominate, so no readahead
+    MMAP_ADVICE = getattr(mmap, "MADV_RANDOM", None)
+    # Hints for a batch read in (file_id, start) order, over the ranges the batch covers:
+    # readahead is started for every range before the first one is copied out
+    BATCH_MMAP_ADVICE = getattr(mmap, "MADV_WILLNEED", None)
+    BATCH_FADVICE = getattr(os, "POSIX_FADV_WILLNEED", None)
 
     def __init__(
         self,
         index_dir: Union[str, Path],
         readonly: bool = True,
         map_size: int = 1 << 40,
+        prefetch_hot: bool = False,
+        bulk_load: bool = False,
+        rebuild: bool = False,
     ):
+        """
+        bulk_load (writable only): open with MDB_WRITEMAP | MDB_NOSYNC | MDB_NOMETASYNC
+        | MDB_MAPASYNC. Commits no longer fsync and a crash may leave the env corrupt,
+        so this is meant for full rebuilds only; the writer must call
+        env.sync(True) when done.
+        rebuild (writable only): opened for a full rebuild; an index with another
+        schema_version is emptied (all tables dropped) instead of rejected.
+        """
         self.index_dir = Path(index_dir)
         self.readonly = readonly
+        bulk_load = bulk_load and not readonly
+        rebuild = rebuild and not readonly
 
         self.env = lmdb.open(
             str(self.index_dir),
@@ -69,19 +164,78 @@ class SDFIndex:
             max_dbs=32,
             subdir=True,
             create=not readonly,
-            metasync=not readonly,
-            sync=not readonly,
+            metasync=not readonly and not bulk_load,
+            sync=not readonly and not bulk_load,
+            writemap=bulk_load,
+            map_async=bulk_load,
         )
 
         self.db_meta = self.env.open_db(b"meta")
-        self.db_files = self.env.open_db(b"files")
+        # Older layouts have different key encodings (and DB flags): check before opening
+        version = self.get_meta().get("schema_version")
+        if version is not None and version != self.SCHEMA_VERSION and rebuild:
+            self._drop_all_tables()
+        elif version is not None and version != self.SCHEMA_VERSION:
+            self.env.close()
+            raise RuntimeError(
+                f"Index schema_version={version}, expected {self.SCHEMA_VERSION}; "
+                "run `main.py migrate` or rebuild the index"
+            )
+
+        self.db_files = self.env.open_db(b"files", integerkey=True)
         self.db_files_rev = self.env.open_db(b"files_rev")
         self.db_records = self.env.open_db(b"records")
-        self.db_cid_to_compound = self.env.open_db(b"cid_to_compound")
         self.db_confid_to_conf = self.env.open_db(b"confid_to_conf")
         self.db_cid2conf_h = self.env.open_db(b"cid_to_conformers_h")
         self.db_cid2conf_p = self.env.open_db(b"cid_to_conformers_p")
 
+        # file_id -> relpath; the file table never changes for a built index
+        self._file_path_cache: Dict[int, str] = {}
+        # absolute path -> unbuffered handle, least recently used first
+        self._fd_cache: "OrderedDict[str, io.FileIO]" = OrderedDict()
+        # absolute path -> read-only mapping of the whole file
+        self._mmap_cache: "OrderedDict[str, mmap.mmap]" = OrderedDict()
+        # absolute .gz path -> indexed_gzip handle (seek points imported from .gzi)
+        self._gz_cache: OrderedDict = OrderedDict()
+
+        # Hot CID cache (see prefetch_compounds): sorted CIDs + packed entries
+        self._hot_cids: Optional[np.ndarray] = None
+        self._hot_payload = b""
+        self._hot_complete = False
+        self._hot_last: Tuple[Optional[int], Optional[IndexHit]] = (None, None)
+        # cid -> (page_no, offset_in_page) of the next conformer not yet yielded
+        self._confpage_cursor: Dict[int, Tuple[int, int]] = {}
+        if prefetch_hot:
+            self.prefetch_compounds()
+
+    def _drop_all_tables(self) -> None:
+        """Delete every named DB but `meta`, which is emptied (old layouts differ in flags)."""
+        with self.env.begin(write=True) as txn:
+            names = [k for k in txn.cursor().iternext(values=False) if k != b"meta"]
+            for name in names:
+                txn.drop(self.env.open_db(name, txn=txn, create=False), delete=True)
+            txn.drop(self.db_meta, delete=False)
+
+    def _close_files(self) -> None:
+        for gz in self._gz_cache.values():
+            gz.close()
+        self._gz_cache.clear()
+        for mm in self._mmap_cache.values():
+            mm.close()
+        self._mmap_cache.clear()
+        for f in self._fd_cache.values():
+            f.close()
+        self._fd_cache.clear()
+
+    def close(self) -> None:
+        """Close cached SDF mappings / file handles and the LMDB environment."""
+        self._close_files()
+        self.env.close()
+
+    def __del__(self):
+        if hasattr(self, "_mmap_cache"):
+            self._close_files()
+
     # -------- metadata --------
 
     def get_meta(self) -> Dict:
@@ -114,12 +268,12 @@ class SDFIndex:
         file_id = counter + 1
         txn.put(b"file_id_counter", file_id.to_bytes(8, "little"), db=self.db_meta)
         txn.put(k, file_id.to_bytes(8, "little"), db=self.db_files_rev)
-        txn.put(file_id.to_bytes(8, "little"), k, db=self.db_files)
+        txn.put(_file_id_key(file_id), k, db=self.db_files)
         return file_id
 
     def resolve_file_path(self, file_id: int) -> Optional[str]:
         with self.env.begin(db=self.db_files) as txn:
-            b = txn.get(int(file_id).to_bytes(8, "little"))
+            b = txn.get(_file_id_key(file_id))
             return None if not b else b.decode("utf-8")
 
     # -------- record access --------
@@ -136,35 +290,79 @@ class SDFIndex:
         else:
             alid_u = alid
 
-        key_c = b"C" + alid_u.bytes
-        key_f = b"F" + alid_u.bytes
-
-        with self.env.begin(db=self.db_records) as txn:
-            if is_conformer is None:
-                b = txn.get(key_c)
-                if b:
-                    return IndexHit(alid_u, RecordLocator.from_bytes(b))
-                b = txn.get(key_f)
-                if b:
-                    return IndexHit(alid_u, RecordLocator.from_bytes(b))
+        rec_key = _key_from_alid(alid_u.bytes)
+        if rec_key is None:
+            return None
+        with self.env.begin() as txn:
+            if is_conformer is not None and (rec_key[:1] == b"F") != is_conformer:
                 return None
-
-            b = txn.get(key_f if is_conformer else key_c)
+            b = txn.get(rec_key, db=self.db_records)
             if not b:
                 return None
-            return IndexHit(alid_u, RecordLocator.from_bytes(b))
+            return IndexHit(alid_u.bytes, RecordLocator.from_bytes(b))
+
+    # -------- hot CID cache --------
+
+    def prefetch_compounds(self, cids: Optional[Iterable[int]] = None) -> int:
+        """
+        Load CID -> (locator, ALID) into memory for `cids`, or for every compound if None.
+        Lookups then run np.searchsorted over a sorted int64 array instead of an LMDB
+        B+tree descent. Returns the number of cached compounds.
+        """
+        with self.env.begin() as txn:
+            rec_cur = txn.cursor(db=self.db_records)
+            if cids is None:
+                # b"C" keys are contiguous and big-endian: the walk is in numeric order
+                found = []
+                if rec_cur.set_range(b"C"):
+                    for k, v in rec_cur.iternext():
+                        if k[:1] != b"C":
+                            break
+                        found.append((int.from_bytes(k[1:], "big"), v))
+            else:
+                keys = [
+                    _compound_key(c) for c in sorted(set(int(c) for c in cids)) if _is_cid(c)
+                ]
+                rec_vals = self._sorted_cursor_get(rec_cur, keys)
+                found = [
+                    (int.from_bytes(k[1:], "big"), rv)
+                    for k, rv in zip(keys, rec_vals)
+                    if rv
+                ]
+
+        self._hot_cids = np.fromiter((c for c, _ in found), dtype=np.int64, count=len(found))
+        self._hot_payload = b"".join(entry for _, entry in found)
+        self._hot_complete = cids is None
+        self._hot_last = (None, None)
+        return len(found)
+
+    def _hot_get(self, cid: int) -> Optional[IndexHit]:
+        last_cid, last_hit = self._hot_last
+        if cid == last_cid:
+            return last_hit
+        i = int(np.searchsorted(self._hot_cids, cid))
+        if i == len(self._hot_cids) or self._hot_cids[i] != cid:
+            return None
+        off = i * HOT_ENTRY_SIZE
+        entry = self._hot_payload[off : off + HOT_ENTRY_SIZE]
+        hit = IndexHit.from_value(_compound_key(cid), entry)
+        self._hot_last = (cid, hit)
+        return hit
 
     def get_compound_by_cid(self, cid: int) -> Optional[IndexHit]:
-        k = str(int(cid)).encode("ascii")
+        cid = int(cid)
+        if not _is_cid(cid):
+            return None
+        if self._hot_cids is not None:
+            hit = self._hot_get(cid)
+            if hit is not None or self._hot_complete:
+                return hit
+        k = _compound_key(cid)
         with self.env.begin() as txn:
-            rec_key = txn.get(k, db=self.db_cid_to_compound)
-            if not rec_key:
-                return None
-            b = txn.get(rec_key, db=self.db_records)
+            b = txn.get(k, db=self.db_records)
             if not b:
                 return None
-            alid = uuid.UUID(bytes=rec_key[1:17])
-            return IndexHit(alid, RecordLocator.from_bytes(b))
+            return IndexHit.from_value(k, b)
 
     def get_conformer_by_conformer_id(self, conformer_id: str) -> Optional[IndexHit]:
         k = conformer_id.encode("utf-8")
@@ -175,40 +373,91 @@ class SDFIndex:
             b = txn.get(rec_key, db=self.db_records)
             if not b:
                 return None
-            alid = uuid.UUID(bytes=rec_key[1:17])
-            return IndexHit(alid, RecordLocator.from_bytes(b))
+            return IndexHit.from_value(rec_key, b)
 
-    def iter_conformers_by_cid(self, cid: int) -> Iterator[IndexHit]:
+    def iter_conformers_by_cid(
+        self, cid: int, resume_from: bool = False
+    ) -> Iterator[IndexHit]:
         """
         Stream conformer records for a CID using posting list pages.
         Suitable for huge N (hundreds of thousands).
+        Each page is turned into record keys in one NumPy pass and resolved with a
+        single cursor.getmulti call.
+
+        With resume_from=True the stream continues after the last conformer yielded by
+        the previous resume_from stream for this CID (instead of re-walking from page 0),
+        and records its own position for the next one; once the end is reached further
+        resumes yield nothing until reset_conformer_cursor(cid).
         """
-        cid_k = str(int(cid)).encode("ascii")
+        cid = int(cid)
+        if not _is_cid(cid):
+            return
+        cid_k = _cid_key(cid)
+        start_page, start_off = (
+            self._confpage_cursor.get(cid, (0, 0)) if resume_from else (0, 0)
+        )
         with self.env.begin() as txn:
             h = txn.get(cid_k, db=self.db_cid2conf_h)
             if not h:
                 return
             page_count = int.from_bytes(h, "little", signed=False)
-            for page_no in range(page_count):
-                pk = cid_k + b"|" + str(page_no).encode("ascii")
+            rec_cur = txn.cursor(db=self.db_records)
+            for page_no in range(start_page, page_count):
+                pk = _pl_page_key(cid_k, page_no)
                 blob = txn.get(pk, db=self.db_cid2conf_p)
                 if not blob:
                     continue
-                # blob is concatenated uuid16 list
-                for i in range(0, len(blob), 16):
-                    ubytes = blob[i : i + 16]
-                    if len(ubytes) < 16:
-                        break
-                    rec_key = b"F" + ubytes
-                    rec_val = txn.get(rec_key, db=self.db_records)
-                    if not rec_val:
-                        continue
-                    yield IndexHit(
-                        uuid.UUID(bytes=ubytes), RecordLocator.from_bytes(rec_val)
-                    )
+                # blob is concatenated record_id list; prepend b"F" to every row at once
+                off0 = start_off if page_no == start_page else 0
+                n = len(blob) // RECORD_ID_SIZE - off0
+                if n <= 0:
+                    continue
+                keys = np.empty((n, 1 + RECORD_ID_SIZE), dtype=np.uint8)
+                keys[:, 0] = ord("F")
+                keys[:, 1:] = np.frombuffer(
+                    blob,
+                    dtype=np.uint8,
+                    count=n * RECORD_ID_SIZE,
+                    offset=off0 * RECORD_ID_SIZE,
+                ).reshape(n, RECORD_ID_SIZE)
+                rec_keys = keys.view(f"V{1 + RECORD_ID_SIZE}").ravel().tolist()
+                j = 0
+                for rec_key, rec_val in rec_cur.getmulti(rec_keys):
+                    # getmulti skips missing records: advance to this key's slot
+                    while rec_keys[j] != rec_key:
+                        j += 1
+                    j += 1
+                    if resume_from:
+                        self._confpage_cursor[cid] = (page_no, off0 + j)
+                    yield IndexHit.from_value(rec_key, rec_val)
+            if resume_from:
+                self._confpage_cursor[cid] = (page_count, 0)
+
+    def reset_conformer_cursor(self, cid: Optional[int] = None) -> None:
+        """Forget resume positions for `cid`, or for all CIDs if None."""
+        if cid is None:
+            self._confpage_cursor.clear()
+        else:
+            self._confpage_cursor.pop(int(cid), None)
 
     # -------- batch lookups (high throughput) --------
 
+    @staticmethod
+    def _sorted_cursor_get(
+        cur: lmdb.Cursor, keys: Sequence[Optional[bytes]]
+    ) -> List[Optional[bytes]]:
+        """
+        Look up `keys` in ascending key order so consecutive lookups land on the
+        same (hot) leaf pages; results are returned in the original positions.
+        Uses one Cursor.getmulti call where the binding provides it.
+        """
+        ordered = sorted(k for k in keys if k)
+        if hasattr(cur, "getmulti"):
+            found = dict(cur.getmulti(ordered))
+        else:
+            found = {k: cur.value() for k in ordered if cur.set_key(k)}
+        return [found.get(k) if k else None for k in keys]
+
     def batch_get_compounds_by_cid(
         self,
         cids: Iterable[int],
@@ -217,22 +466,19 @@ class SDFIndex:
         """
         Stream results: (cid, hit_or_none)
         Designed for tens/hundreds of thousands keys.
+        Each chunk is resolved with one sorted cursor pass over the CID record keys.
         """
         with self.env.begin() as txn:
+            rec_cur = txn.cursor(db=self.db_records)
             for chunk in _chunked(cids, chunk_size):
-                # local loop: per key approx constant cost
-                for cid in chunk:
-                    k = str(int(cid)).encode("ascii")
-                    rec_key = txn.get(k, db=self.db_cid_to_compound)
-                    if not rec_key:
-                        yield int(cid), None
-                        continue
-                    rec_val = txn.get(rec_key, db=self.db_records)
+                # out-of-range CIDs get no key: _sorted_cursor_get maps them to None
+                keys = [_compound_key(c) if _is_cid(int(c)) else None for c in chunk]
+                rec_vals = self._sorted_cursor_get(rec_cur, keys)
+                for cid, rec_key, rec_val in zip(chunk, keys, rec_vals):
                     if not rec_val:
                         yield int(cid), None
                         continue
-                    alid = uuid.UUID(bytes=rec_key[1:17])
-                    yield int(cid), IndexHit(alid, RecordLocator.from_bytes(rec_val))
+                    yield int(cid), IndexHit.from_value(rec_key, rec_val)
 
     def batch_get_conformers_by_conformer_id(
         self,
@@ -240,30 +486,231 @@ class SDFIndex:
         chunk_size: int = 50000,
     ) -> Iterator[Tuple[str, Optional[IndexHit]]]:
         with self.env.begin() as txn:
+            conf_cur = txn.cursor(db=self.db_confid_to_conf)
+            rec_cur = txn.cursor(db=self.db_records)
             for chunk in _chunked(conformer_ids, chunk_size):
-                for confid in chunk:
-                    k = confid.encode("utf-8")
-                    rec_key = txn.get(k, db=self.db_confid_to_conf)
-                    if not rec_key:
-                        yield confid, None
-                        continue
-                    rec_val = txn.get(rec_key, db=self.db_records)
+                keys = list(map(str.encode, chunk))
+                rec_keys = self._sorted_cursor_get(conf_cur, keys)
+                rec_vals = self._sorted_cursor_get(rec_cur, rec_keys)
+                for confid, rec_key, rec_val in zip(chunk, rec_keys, rec_vals):
                     if not rec_val:
                         yield confid, None
                         continue
-                    alid = uuid.UUID(bytes=rec_key[1:17])
-                    yield confid, IndexHit(alid, RecordLocator.from_bytes(rec_val))
+                    yield confid, IndexHit.from_value(rec_key, rec_val)
 
     # -------- read raw segment --------
 
+    def _get_file_path(self, file_id: int) -> str:
+        rel = self._file_path_cache.get(file_id)
+        if rel is None:
+            rel = self.resolve_file_path(file_id)
+            if not rel:
+                raise KeyError(f"file_id={file_id} not found in index")
+            self._file_path_cache[file_id] = rel
+        return rel
+
+    def _get_fd(self, root_dir: Union[str, Path], file_id: int) -> io.FileIO:
+        fp = os.path.join(root_dir, self._get_file_path(file_id))
+        f = self._fd_cache.get(fp)
+        if f is not None:
+            self._fd_cache.move_to_end(fp)
+            return f
+        f = open(fp, "rb", buffering=0)
+        self._fd_cache[fp] = f
+        if len(self._fd_cache) > self.FD_CACHE_SIZE:
+            _, oldest = self._fd_cache.popitem(last=False)
+            oldest.close()
+        return f
+
+    def _get_mmap(self, root_dir: Union[str, Path], file_id: int) -> mmap.mmap:
+        fp = os.path.join(root_dir, self._get_file_path(file_id))
+        mm = self._mmap_cache.get(fp)
+        if mm is not None:
+            self._mmap_cache.move_to_end(fp)
+            return mm
+        with open(fp, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.MMAP_ADVICE is not None:
+            mm.madvise(self.MMAP_ADVICE)
+        self._mmap_cache[fp] = mm
+        if len(self._mmap_cache) > self.FD_CACHE_SIZE:
+            _, oldest = self._mmap_cache.popitem(last=False)
+            oldest.close()
+        return mm
+
+    def advise_segments(self, root_dir: Union[str, Path], locators: Sequence[RecordLocator]) -> None:
+        """
+        Hint the mappings that `locators` are about to be read with read_segment: one
+        madvise(BATCH_MMAP_ADVICE) per run of records on the same file less than a page
+        apart. The rest of each mapping keeps MMAP_ADVICE.
+        """
+        if self.BATCH_MMAP_ADVICE is None:
+            return
+        ordered = sorted(locators, key=lambda loc: (loc.file_id, loc.start))
+        pos = 0
+        while pos < len(ordered):
+            first = ordered[pos]
+            base, end = first.start, first.end
+            pos += 1
+            while pos < len(ordered):
+                loc = ordered[pos]
+                if loc.file_id != first.file_id or loc.start - end >= mmap.PAGESIZE:
+                    break
+                end = max(end, loc.end)
+                pos += 1
+            if end > base:
+                mm = self._get_mmap(root_dir, first.file_id)
+                page = base - base % mmap.PAGESIZE
+                mm.madvise(self.BATCH_MMAP_ADVICE, page, end - page)
+
     def read_segment(self, root_dir: Union[str, Path], locator: RecordLocator) -> bytes:
         """
         Read the raw SDF record text segment using locator offsets.
+        Files are mapped once and cached per index; a segment is a single slice of the mapping.
+        """
+        mm = self._get_mmap(root_dir, locator.file_id)
+        return mm[locator.start : locator.end]
+
+    def read_segment_gz(
+        self,
+        root_dir: Union[str, Path],
+        locator: RecordLocator,
+        gzi_path: Optional[Union[str, Path]] = None,
+    ) -> bytes:
         """
-        rel = self.resolve_file_path(locator.file_id)
-        if not rel:
-            raise KeyError(f"file_id={locator.file_id} not found in index")
-        fp = Path(root_dir) / rel
-        with fp.open("rb") as f:
-            f.seek(locator.start)
-            return f.read(locator.end - locator.start)
+        Read a record straight from the compressed `<relpath>.gz` next to where the .sdf
+        would be. Offsets are uncompressed offsets, so the locator is the same one
+        read_segment uses. `gzi_path` defaults to `<relpath>.gz.gzi`; without a sidecar
+        the seek points are built on first access. Extracted .sdf via read_segment
+        remains the fast path.
+        """
+        gz_fp = os.path.join(root_dir, self._get_file_path(locator.file_id) + ".gz")
+        gz = self._gz_cache.get(gz_fp)
+        if gz is None:
+            gz = open_indexed_gzip(gz_fp, gzi_path or gz_fp + ".gzi")
+            self._gz_cache[gz_fp] = gz
+            if len(self._gz_cache) > self.FD_CACHE_SIZE:
+                _, oldest = self._gz_cache.popitem(last=False)
+                oldest.close()
+        else:
+            self._gz_cache.move_to_end(gz_fp)
+        gz.seek(locator.start)
+        return gz.read(locator.end - locator.start)
+
+    def read_segments_batch(
+        self, root_dir: Union[str, Path], locators: Sequence[RecordLocator]
+    ) -> List[bytes]:
+        """
+        Read many segments, returned in the order of `locators`.
+        With liburing installed, reads are submitted to io_uring IO_URING_BATCH at a time
+        (one syscall per batch, kernel free to reorder) into registered buffers; without
+        liburing, or if the ring cannot be set up, falls back to read_segment.
+        """
+        if liburing is None or not locators:
+            return [self.read_segment(root_dir, loc) for loc in locators]
+
+        ring = liburing.Ring()
+        try:
+            liburing.io_uring_queue_init(IO_URING_DEPTH, ring)
+        except OSError:
+            # io_uring unavailable (old kernel, seccomp / container policy)
+            return [self.read_segment(root_dir, loc) for loc in locators]
+        try:
+            return self._read_segments_uring(ring, root_dir, locators)
+        finally:
+            liburing.io_uring_queue_exit(ring)
+
+    def _read_segments_uring(
+        self, ring, root_dir: Union[str, Path], locators: Sequence[RecordLocator]
+    ) -> List[bytes]:
+        bufs = [bytearray(loc.end - loc.start) for loc in locators]
+        cqe = liburing.Cqe()
+        # registered (fixed) buffers save the per-read page pinning; dropped for the
+        # rest of the call if registration is refused (e.g. RLIMIT_MEMLOCK)
+        use_fixed = not _PREP_READ_TAKES_NBYTES
+        for base in range(0, len(locators), IO_URING_BATCH):
+            batch = [
+                i for i in range(base, min(base + IO_URING_BATCH, len(locators))) if bufs[i]
+            ]
+            if not batch:
+                continue
+            iov = None
+            if use_fixed:
+                try:
+                    iov = liburing.Iovec([bufs[i] for i in batch])
+                    liburing.io_uring_register_buffers(ring, iov)
+                except OSError:
+                    iov = None
+                    use_fixed = False
+            for j, i in enumerate(batch):
+                loc = locators[i]
+                fd = self._get_fd(root_dir, loc.file_id).fileno()
+                sqe = liburing.io_uring_get_sqe(ring)
+                if iov is not None:
+                    liburing.io_uring_prep_read_fixed(sqe, fd, bufs[i], j, loc.start)
+                elif _PREP_READ_TAKES_NBYTES:
+                    liburing.io_uring_prep_read(sqe, fd, bufs[i], len(bufs[i]), loc.start)
+                else:
+                    liburing.io_uring_prep_read(sqe, fd, bufs[i], loc.start)
+                liburing.io_uring_sqe_set_data64(sqe, i)
+            liburing.io_uring_submit(ring)
+            short = []
+            for _ in batch:
+                liburing.io_uring_wait_cqe(ring, cqe)
+                c = cqe[0]
+                i = liburing.io_uring_cqe_get_data64(c)
+                res = c.res
+                liburing.io_uring_cqe_seen(ring, c)
+                if res != len(bufs[i]):
+                    # error or short read (e.g. interrupted); redo this one synchronously
+                    short.append(i)
+            if iov is not None:
+                liburing.io_uring_unregister_buffers(ring)
+            for i in short:
+                bufs[i] = self.read_segment(root_dir, locators[i])
+        return [bytes(b) for b in bufs]
+
+    def read_segments_coalesced(
+        self,
+        root_dir: Union[str, Path],
+        locators: Sequence[RecordLocator],
+        max_span: int = COALESCE_MAX_SPAN,
+    ) -> List[bytes]:
+        """
+        Read many segments, returned in the order of `locators`.
+        Locators are sorted by (file_id, start) and grouped into runs on the same file
+        spanning at most `max_span` bytes; each run is one pread and segments are sliced
+        out of it. A record larger than `max_span` is read on its own. All runs are
+        announced with posix_fadvise(BATCH_FADVICE) before the first pread.
+        """
+        out: List[Optional[bytes]] = [None] * len(locators)
+        order = sorted(
+            range(len(locators)),
+            key=lambda i: (locators[i].file_id, locators[i].start),
+        )
+        runs: List[Tuple[int, int, int, List[int]]] = []  # (file_id, base, end, indices)
+        pos = 0
+        while pos < len(order):
+            first = locators[order[pos]]
+            base, end = first.start, first.end
+            run_end = pos + 1
+            while run_end < len(order):
+                loc = locators[order[run_end]]
+                if loc.file_id != first.file_id or max(end, loc.end) - base > max_span:
+                    break
+                end = max(end, loc.end)
+                run_end += 1
+            runs.append((first.file_id, base, end, order[pos:run_end]))
+            pos = run_end
+
+        if self.BATCH_FADVICE is not None and len(runs) > 1:
+            for file_id, base, end, _ in runs:
+                fd = self._get_fd(root_dir, file_id).fileno()
+                os.posix_fadvise(fd, base, end - base, self.BATCH_FADVICE)
+        for file_id, base, end, indices in runs:
+            f = self._get_fd(root_dir, file_id)
+            buf = memoryview(os.pread(f.fileno(), end - base, base))
+            for i in indices:
+                loc = locators[i]
+                out[i] = bytes(buf[loc.start - base : loc.end - base])
+        return out
@@ -11,20 +11,37 @@
 ********************************************************** '''
 from __future__ import annotations
 
+import os
 import re
+import mmap
 import time
 import lmdb
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
-from typing import Optional, Dict, List, Union
+from typing import Iterable, Iterator, NamedTuple, Optional, Dict, List, Tuple, Union
 from rich.progress import track
+from nih.pubchem.index._sdf_scan import (
+    FIELD_CID,
+    FIELD_CONFID,
+    FIELD_PARENT_CID,
+    FieldTable,
+    ScanResult,
+    make_field_table,
+    scan_records,
+)
 from nih.pubchem.index.record_locator import RecordLocator
 from nih.pubchem.index.sdf_index import SDFIndex
 from nih.pubchem.index.utils_module import (
+    RECORD_ID_SIZE,
+    _cid_key,
+    _compound_key,
     _determine_kind,
-    _is_int_ascii,
     _iter_sdf_files,
-    _make_alid,
+    _make_record_id,
     _norm_field_name,
+    _pl_page_key,
     _uuid_to_keyprefix,
 )
 
@@ -69,13 +86,64 @@ PARENT_CID_FIELD_CANDIDATES = [
 ]
 
 
-# Posting list page size: number of ALIDs per page
+# Posting list page size: number of record ids per page
 PL_PAGE_SIZE = 4096
+# Commit the shared build txn once this many records are pending (checked between files)
+COMMIT_EVERY_RECORDS = 100_000
+# Scanned files a worker may run ahead of the writer (bounds memory held in results)
+SCAN_PREFETCH_PER_WORKER = 2
 # -----------------------------
 # Builder
 # -----------------------------
 
 
+class _FileScan(NamedTuple):
+    """Worker output for one SDF file; holds no LMDB state (file_id is assigned by the writer)."""
+
+    relpath: str
+    kind: str
+    scan: ScanResult
+    conf_ids: List[Optional[str]]
+
+
+def _scan_one_file_to_records(
+    fp: Path, relpath: str, kind: str, table: FieldTable, advice: Optional[int]
+) -> _FileScan:
+    """
+    Scan one SDF file: record offsets and extracted ids, no LMDB I/O.
+    Module-level so it can run in a worker process.
+    """
+    compound = kind == "compound"
+    if fp.stat().st_size == 0:  # mmap cannot map an empty file
+        res = scan_records(b"", table, compound)
+        return _FileScan(relpath, kind, res, [])
+
+    # The whole file is mapped and scanned in one call: offsets in the scan
+    # result are file offsets, and no bytes are copied into Python buffers.
+    with fp.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if advice is not None:
+            mm.madvise(advice)
+        res = scan_records(mm, table, compound)
+        conf_ids = [
+            mm[off : off + n].decode("utf-8", errors="replace") if off >= 0 else None
+            for off, n in zip(res.confid_offs.tolist(), res.confid_lens.tolist())
+        ]
+    return _FileScan(relpath, kind, res, conf_ids)
+
+
+class _PendingWrites:
+    """
+    Puts of one commit batch, grouped per DB. Applied one DB at a time in key order,
+    so each B+tree sees a single sorted run instead of file-order interleaving.
+    """
+
+    def __init__(self) -> None:
+        self.records: List[Tuple[bytes, bytes]] = []
+        self.confid_to_conf: List[Tuple[bytes, bytes]] = []
+        # CID -> conformer record ids in file order
+        self.postings: Dict[int, List[bytes]] = defaultdict(list)
+
+
 class SDFIndexBuilder:
     """
     Build index for a directory of SDF files.
@@ -84,8 +152,16 @@ class SDFIndexBuilder:
     - filename patterns to classify compound vs conformer
     - field candidates for CID / conformer_id / parent CID
     - LMDB map_size
+    - MMAP_ADVICE: page-cache hint for the mapped SDF files while scanning
+    - bulk_load: open the env without fsync (writemap/nosync) for the rebuild and
+      flush once at the end; a crashed build must be rerun from scratch
+    - workers: processes scanning files in parallel (default os.cpu_count(); <= 1 scans
+      in-process). LMDB writes stay in this process, in file order.
     """
 
+    # each file is read front to back exactly once: let the kernel read ahead aggressively
+    MMAP_ADVICE = getattr(mmap, "MADV_SEQUENTIAL", None)
+
     def __init__(
         self,
         root_dir: Union[str, Path],
@@ -97,41 +173,69 @@ class SDFIndexBuilder:
         conformer_id_fields: Optional[List[str]] = None,
         parent_cid_fields: Optional[List[str]] = None,
         verbose: bool = True,
+        bulk_load: bool = True,
+        workers: Optional[int] = None,
     ):
         self.root_dir = Path(root_dir).resolve()
         self.index_dir = Path(index_dir).resolve()
         self.map_size = map_size
         self.verbose = verbose
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+
+        # one alternation per kind: a single search per file name
+        self._compound_re = re.compile(
+            "|".join(
+                f"(?:{p})" for p in (compound_name_patterns or DEFAULT_COMPOUND_PATTERNS)
+            ),
+            re.I,
+        )
+        self._conformer_re = re.compile(
+            "|".join(
+                f"(?:{p})" for p in (conformer_name_patterns or DEFAULT_CONFORMER_PATTERNS)
+            ),
+            re.I,
+        )
 
-        self.compound_patterns = [
-            re.compile(p, re.I)
-            for p in (compound_name_patterns or DEFAULT_COMPOUND_PATTERNS)
-        ]
-        self.conformer_patterns = [
-            re.compile(p, re.I)
-            for p in (conformer_name_patterns or DEFAULT_CONFORMER_PATTERNS)
-        ]
-
-        self.cid_fields = [
+        self.cid_fields = frozenset(
             _norm_field_name(x) for x in (cid_fields or CID_FIELD_CANDIDATES)
-        ]
-        self.confid_fields = [
+        )
+        self.confid_fields = frozenset(
             _norm_field_name(x)
             for x in (conformer_id_fields or CONFORMER_ID_FIELD_CANDIDATES)
-        ]
-        self.parent_cid_fields = [
+        )
+        self.parent_cid_fields = frozenset(
             _norm_field_name(x)
             for x in (parent_cid_fields or PARENT_CID_FIELD_CANDIDATES)
-        ]
+        )
+        # normalized field name -> FIELD_* bit mask, one dict lookup per property
+        self._field_kind: Dict[str, int] = {}
+        for fields, bit in (
+            (self.cid_fields, FIELD_CID),
+            (self.parent_cid_fields, FIELD_PARENT_CID),
+            (self.confid_fields, FIELD_CONFID),
+        ):
+            for fn in fields:
+                self._field_kind[fn] = self._field_kind.get(fn, 0) | bit
+        self._scan_table = make_field_table(self._field_kind)
+        # relpath -> file_id, filled during one build(); cleared when the next starts
+        self._file_id_cache: Dict[str, int] = {}
 
         self.index_dir.mkdir(parents=True, exist_ok=True)
 
         # Open writable index
-        self.idx = SDFIndex(self.index_dir, readonly=False, map_size=self.map_size)
+        # build() rewrites everything: an index of an older schema is emptied, not rejected
+        self.idx = SDFIndex(
+            self.index_dir,
+            readonly=False,
+            map_size=self.map_size,
+            bulk_load=bulk_load,
+            rebuild=True,
+        )
 
     def build(self) -> Dict:
         """
-        Full rebuild (safe and deterministic for ALID generation).
+        Full rebuild (safe and deterministic for ALID generation): records and the
+        secondary tables are cleared first, file_ids are kept.
         If you need incremental updates, we can extend with per-file manifests.
         """
         # Write meta
@@ -142,237 +246,225 @@ class SDFIndexBuilder:
             "pl_page_size": PL_PAGE_SIZE,
         }
         self.idx._set_meta(meta)
+        # the files table may have been rewritten since the last build (migrate, reset)
+        self._file_id_cache.clear()
 
         sdf_files = sorted(_iter_sdf_files(self.root_dir))
+        jobs = []
+        for fp in sdf_files:
+            relpath = str(fp.relative_to(self.root_dir)).replace("\\", "/")
+            kind = _determine_kind(fp, self._compound_re, self._conformer_re)
+            jobs.append((fp, relpath, kind, self._scan_table, self.MMAP_ADVICE))
+        scans = self._iter_scans(jobs)
         it = (
-            track(sdf_files, description="Indexing SDF")
+            track(scans, total=len(jobs), description="Indexing SDF")
             if self.verbose
-            else sdf_files
+            else scans
         )
 
         total_files = 0
         total_records = 0
         total_compounds = 0
         total_conformers = 0
-
-        for fp in it:
-            relpath = str(fp.relative_to(self.root_dir)).replace("\\", "/")
-            kind = _determine_kind(fp, self.compound_patterns, self.conformer_patterns)
-            stats = self._index_one_file(fp, relpath, kind)
-            total_files += 1
-            total_records += stats["records"]
-            total_compounds += stats["compounds"]
-            total_conformers += stats["conformers"]
-
-        # Update meta with stats
+        dropped = 0
+
+        # One write txn spans many files: every commit is an fsync, so only
+        # commit once COMMIT_EVERY_RECORDS records have accumulated.
+        pending = 0
+        writes = _PendingWrites()
+        txn = self.idx.env.begin(write=True)
+        try:
+            # entries of a previous build may point at offsets that no longer exist
+            for db in (
+                self.idx.db_records,
+                self.idx.db_confid_to_conf,
+                self.idx.db_cid2conf_h,
+                self.idx.db_cid2conf_p,
+            ):
+                txn.drop(db, delete=False)
+            for scan in it:
+                stats = self._write_file(txn, scan, writes)
+                total_files += 1
+                total_records += stats["records"]
+                total_compounds += stats["compounds"]
+                total_conformers += stats["conformers"]
+
+                pending += stats["records"]
+                if pending >= COMMIT_EVERY_RECORDS:
+                    dropped += self._flush(txn, writes)
+                    txn.commit()
+                    txn = self.idx.env.begin(write=True)
+                    writes = _PendingWrites()
+                    pending = 0
+            dropped += self._flush(txn, writes)
+            txn.commit()
+        except BaseException:
+            txn.abort()
+            # ids created in the aborted txn were never stored
+            self._file_id_cache.clear()
+            raise
+
+        if dropped and self.verbose:
+            print(f"{dropped} compound records dropped: a later record has the same CID")
+
+        # Update meta with stats (records actually stored)
         meta2 = self.idx.get_meta()
         meta2.update(
             {
                 "total_files": total_files,
-                "total_records": total_records,
-                "total_compound_records": total_compounds,
+                "total_records": total_records - dropped,
+                "total_compound_records": total_compounds - dropped,
                 "total_conformer_records": total_conformers,
+                "duplicate_cid_records_dropped": dropped,
             }
         )
         self.idx._set_meta(meta2)
+        # bulk_load commits skip fsync: flush everything to disk once here
+        self.idx.env.sync(True)
 
         return meta2
 
-    def _index_one_file(self, fp: Path, relpath: str, kind: str) -> Dict[str, int]:
+    def _iter_scans(self, jobs: Iterable[Tuple]) -> Iterator[_FileScan]:
+        """
+        Yield _scan_one_file_to_records results in job order. With workers > 1 the scans
+        run in a process pool, at most workers * SCAN_PREFETCH_PER_WORKER ahead of the
+        consumer, so file_ids are still assigned in sorted path order.
+        """
+        if self.workers <= 1:
+            for job in jobs:
+                yield _scan_one_file_to_records(*job)
+            return
+
+        it = iter(jobs)
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = deque(
+                executor.submit(_scan_one_file_to_records, *job)
+                for job in islice(it, self.workers * SCAN_PREFETCH_PER_WORKER)
+            )
+            while futures:
+                scan = futures.popleft().result()
+                job = next(it, None)
+                if job is not None:
+                    futures.append(executor.submit(_scan_one_file_to_records, *job))
+                yield scan
+
+    def _write_file(
+        self, txn: lmdb.Transaction, fs: _FileScan, writes: _PendingWrites
+    ) -> Dict[str, int]:
         """
-        Stream scan SDF file in binary mode; parse record boundaries and needed fields.
+        Queue one scanned file's puts into `writes`; only the file_id is written to txn
+        here. build() flushes the batch before each commit.
         """
         records = 0
         compounds = 0
         conformers = 0
 
-        # We'll commit per file in a single write txn for performance.
-        # Note: if a file is extremely huge, you can commit per N records; this is already robust for GB.
-        with self.idx.env.begin(write=True) as txn:
-            file_id = self.idx._get_or_create_file_id(txn, relpath)
-
-            with fp.open("rb") as f:
-                # record state
-                rec_start = f.tell()
-                rec_no = 0
-
-                title_line: Optional[bytes] = None
-                in_prop = False
-                cur_field: Optional[str] = None
-                cur_val_lines: List[bytes] = []
-
-                # extracted per record
-                cid_val: Optional[int] = None
-                conf_id_val: Optional[str] = None
-                parent_cid_val: Optional[int] = None
-
-                def finalize_field():
-                    nonlocal cur_field, cur_val_lines, cid_val, conf_id_val, parent_cid_val
-                    if not cur_field:
-                        return
-                    # join as SDF property value: take first non-empty line (common convention)
-                    v = None
-                    for line in cur_val_lines:
-                        s = line.strip()
-                        if s:
-                            v = s
-                            break
-
-                    if v is not None:
-                        fn = _norm_field_name(cur_field)
-                        if fn in self.cid_fields and cid_val is None:
-                            if _is_int_ascii(v):
-                                cid_val = int(v.decode("ascii"))
-                        if fn in self.parent_cid_fields and parent_cid_val is None:
-                            if _is_int_ascii(v):
-                                parent_cid_val = int(v.decode("ascii"))
-                        if fn in self.confid_fields and conf_id_val is None:
-                            # conformer_id may be numeric or string; store as string
-                            conf_id_val = v.decode("utf-8", errors="replace")
-
-                    cur_field = None
-                    cur_val_lines = []
-
-                while True:
-                    line = f.readline()
-                    if not line:
-                        # EOF: if partial record exists without $$$$, ignore or handle
-                        break
-
-                    # First line of record (title)
-                    if title_line is None:
-                        title_line = line.rstrip(b"\r\n")
-                        # For compound files, title line often is CID
-                        if kind == "compound":
-                            t = title_line.strip()
-                            if _is_int_ascii(t):
-                                cid_val = int(t.decode("ascii"))
-
-                    # Property header line: > <FIELDNAME>
-                    if line.startswith(b"> <") and line.rstrip().endswith(b">"):
-                        finalize_field()
-                        # Extract between "<" and ">"
-                        try:
-                            # line like: b"> <PUBCHEM_COMPOUND_CID>\n"
-                            m = re.search(rb"> <([^>]+)>", line)
-                            if m:
-                                cur_field = m.group(1).decode("utf-8", errors="replace")
-                                cur_val_lines = []
-                                in_prop = True
-                            else:
-                                cur_field = None
-                                in_prop = False
-                        except Exception:
-                            cur_field = None
-                            in_prop = False
-                        continue
-
-                    # Property value ends at blank line (SDF convention)
-                    if in_prop:
-                        if line.strip() == b"":
-                            finalize_field()
-                            in_prop = False
-                        else:
-                            cur_val_lines.append(line)
-                        # continue reading
-                        pass
-
-                    # Record terminator
-                    if line.strip() == b"$$$$":
-                        finalize_field()
-                        rec_end = f.tell()
-                        # Determine primary_id for ALID generation
-                        if kind == "compound":
-                            primary = str(cid_val) if cid_val is not None else ""
-                            alid = _make_alid("compound", relpath, rec_no, primary)
-                            is_conf = False
-                            eff_cid = cid_val
-                        else:
-                            primary = conf_id_val or ""
-                            alid = _make_alid("conformer", relpath, rec_no, primary)
-                            is_conf = True
-                            # Try to set CID for conformer from either cid_val or parent_cid_val
-                            eff_cid = cid_val if cid_val is not None else parent_cid_val
-
-                        # Store record locator
-                        rec_key = _uuid_to_keyprefix(is_conf) + alid.bytes
-                        loc = RecordLocator(
-                            file_id=file_id,
-                            start=rec_start,
-                            end=rec_end,
-                            is_conformer=is_conf,
-                            cid=eff_cid,
-                        )
-                        txn.put(rec_key, loc.to_bytes(), db=self.idx.db_records)
-
-                        # Secondary indexes
-                        if not is_conf:
-                            # CID -> compound (unique)
-                            if cid_val is not None:
-                                txn.put(
-                                    str(int(cid_val)).encode("ascii"),
-                                    rec_key,
-                                    db=self.idx.db_cid_to_compound,
-                                )
-                            compounds += 1
-                        else:
-                            # conformer_id -> conformer (unique)
-                            if conf_id_val is not None:
-                                txn.put(
-                                    conf_id_val.encode("utf-8"),
-                                    rec_key,
-                                    db=self.idx.db_confid_to_conf,
-                                )
-                            # CID -> conformers posting list (1..N)
-                            if eff_cid is not None:
-                                self._pl_append(txn, eff_cid, alid.bytes)
-                            conformers += 1
-
-                        records += 1
-                        rec_no += 1
-
-                        # reset record state
-                        rec_start = f.tell()
-                        title_line = None
-                        in_prop = False
-                        cur_field = None
-                        cur_val_lines = []
-                        cid_val = None
-                        conf_id_val = None
-                        parent_cid_val = None
+        file_id = self._file_id_cache.get(fs.relpath)
+        if file_id is None:
+            file_id = self.idx._get_or_create_file_id(txn, fs.relpath)
+            self._file_id_cache[fs.relpath] = file_id
+
+        is_conf = fs.kind != "compound"
+        res = fs.scan
+        for rec_no, (rec_start, rec_end, cid, parent_cid, conf_id_val) in enumerate(
+            zip(
+                res.starts.tolist(),
+                res.ends.tolist(),
+                res.cids.tolist(),
+                res.parent_cids.tolist(),
+                fs.conf_ids,
+            )
+        ):
+            cid_val = cid if cid >= 0 else None
+            eff_cid = cid_val
+            if is_conf and eff_cid is None and parent_cid >= 0:
+                # Try to set CID for conformer from either cid_val or parent_cid_val
+                eff_cid = parent_cid
+
+            # Store record locator (the ALID is derived from the record key)
+            rec_id = _make_record_id(file_id, rec_no)
+            rec_key = _uuid_to_keyprefix(is_conf) + rec_id
+            loc = RecordLocator(
+                file_id=file_id,
+                start=rec_start,
+                end=rec_end,
+                is_conformer=is_conf,
+                cid=eff_cid,
+            )
+            rec_val = loc.to_bytes()
+
+            if not is_conf:
+                # the CID is the record key: for a duplicate CID the last record wins,
+                # like conformer_id in confid_to_conf
+                if cid_val is not None:
+                    rec_key = _compound_key(cid_val)
+                writes.records.append((rec_key, rec_val))
+                compounds += 1
+            else:
+                writes.records.append((rec_key, rec_val))
+                # conformer_id -> conformer (unique)
+                if conf_id_val is not None:
+                    writes.confid_to_conf.append((conf_id_val.encode("utf-8"), rec_key))
+                # CID -> conformers posting list (1..N)
+                if eff_cid is not None:
+                    writes.postings[eff_cid].append(rec_id)
+                conformers += 1
+
+            records += 1
 
         return {"records": records, "compounds": compounds, "conformers": conformers}
 
-    def _pl_append(self, txn: lmdb.Transaction, cid: int, uuid16: bytes) -> None:
+    def _flush(self, txn: lmdb.Transaction, writes: _PendingWrites) -> int:
+        """
+        Apply a batch one DB at a time, each in key order (appends where possible).
+        Returns the number of compound records dropped because a later record with
+        the same CID replaced them.
+        """
+        dropped = self._put_sorted(txn, self.idx.db_records, writes.records)
+        self._put_sorted(txn, self.idx.db_confid_to_conf, writes.confid_to_conf)
+        for cid in sorted(writes.postings):
+            self._pl_extend(txn, cid, writes.postings[cid])
+        return dropped
+
+    @staticmethod
+    def _put_sorted(txn: lmdb.Transaction, db, items: List[Tuple[bytes, bytes]]) -> int:
         """
-        Append uuid16 to CID->conformer posting list (paged).
+        Write (key, value) pairs in key order, appending where the key lies past the
+        current tail of `db`. For duplicate keys the last one in `items` wins, and an
+        existing key is overwritten. Returns the number of values replaced.
         """
-        cid_k = str(int(cid)).encode("ascii")
+        items.sort(key=lambda kv: kv[0])
+        cur = txn.cursor(db=db)
+        replaced = 0
+        for k, v in items:
+            if not cur.put(k, v, append=True) and txn.replace(k, v, db=db) is not None:
+                replaced += 1
+        return replaced
+
+    def _pl_extend(self, txn: lmdb.Transaction, cid: int, rec_ids: List[bytes]) -> None:
+        """
+        Append rec_ids to CID->conformer posting list (paged): tops up the last page,
+        then writes full new pages; the header is read and written once per call.
+        """
+        cid_k = _cid_key(cid)
         h = txn.get(cid_k, db=self.idx.db_cid2conf_h)
         page_count = int.from_bytes(h, "little") if h else 0
 
-        if page_count == 0:
-            # create first page
-            page_no = 0
-            pk = cid_k + b"|" + b"0"
-            txn.put(pk, uuid16, db=self.idx.db_cid2conf_p)
-            txn.put(cid_k, (1).to_bytes(4, "little"), db=self.idx.db_cid2conf_h)
-            return
-
-        # append to last page if space
-        last_page_no = page_count - 1
-        pk = cid_k + b"|" + str(last_page_no).encode("ascii")
-        blob = txn.get(pk, db=self.idx.db_cid2conf_p) or b""
-        n = len(blob) // 16
-
-        if n < PL_PAGE_SIZE:
-            txn.put(pk, blob + uuid16, db=self.idx.db_cid2conf_p)
-            return
-
-        # create new page
-        new_page_no = page_count
-        pk2 = cid_k + b"|" + str(new_page_no).encode("ascii")
-        txn.put(pk2, uuid16, db=self.idx.db_cid2conf_p)
-        txn.put(
-            cid_k, (page_count + 1).to_bytes(4, "little"), db=self.idx.db_cid2conf_h
-        )
+        i = 0
+        if page_count > 0:
+            # append to last page if space
+            pk = _pl_page_key(cid_k, page_count - 1)
+            blob = txn.get(pk, db=self.idx.db_cid2conf_p) or b""
+            room = PL_PAGE_SIZE - len(blob) // RECORD_ID_SIZE
+            if room > 0:
+                i = min(room, len(rec_ids))
+                txn.put(pk, blob + b"".join(rec_ids[:i]), db=self.idx.db_cid2conf_p)
+
+        # create new pages
+        new_pages = page_count
+        for j in range(i, len(rec_ids), PL_PAGE_SIZE):
+            pk = _pl_page_key(cid_k, new_pages)
+            txn.put(pk, b"".join(rec_ids[j : j + PL_PAGE_SIZE]), db=self.idx.db_cid2conf_p)
+            new_pages += 1
+        if new_pages != page_count:
+            txn.put(cid_k, new_pages.to_bytes(4, "little"), db=self.idx.db_cid2conf_h)
@@ -13,13 +13,11 @@
 from __future__ import annotations
 
 import re
-import uuid
+import sys
 import hashlib
 from pathlib import Path
-from typing import Iterable, Iterator, List
-
-# UUID namespace for deterministic ALID
-ALID_NAMESPACE = uuid.UUID("6ba7b811-9dad-11d1-80b4-00c04fd430c8")  # UUID namespace URL
+from itertools import islice
+from typing import Iterable, Iterator, Optional, Tuple
 
 
 # -----------------------------
@@ -31,11 +29,6 @@ def _norm_field_name(name: str) -> str:
     return name.strip().upper()
 
 
-def _is_int_ascii(s: bytes) -> bool:
-    # allow leading/trailing spaces already stripped before calling
-    return s.isdigit()
-
-
 def _sha1_bytes(data: bytes) -> bytes:
     return hashlib.sha1(data).digest()
 
@@ -46,21 +39,17 @@ def _iter_sdf_files(root_dir: Path) -> Iterator[Path]:
             yield p
 
 
-def _match_any(patterns: List[re.Pattern], text: str) -> bool:
-    t = text.lower()
-    return any(p.search(t) for p in patterns)
-
 # todo 当前探测方式是通过文件名判断，须改为通过文件内容中是否包含PUBCHEM_CONFORMER_ID属性进行判断
 def _determine_kind(
     file_path: Path,
-    compound_patterns: List[re.Pattern],
-    conformer_patterns: List[re.Pattern],
+    compound_re: re.Pattern,
+    conformer_re: re.Pattern,
 ) -> str:
     name = file_path.name.lower()
     # Prefer explicit conformer match if both match
-    if _match_any(conformer_patterns, name):
+    if conformer_re.search(name):
         return "conformer"
-    if _match_any(compound_patterns, name):
+    if compound_re.search(name):
         return "compound"
     # Fallback heuristic: if contains "conf" anywhere, treat as conformer
     if "conf" in name:
@@ -68,29 +57,87 @@ def _determine_kind(
     return "compound"
 
 
+def _file_id_key(file_id: int) -> bytes:
+    """
+    Key of the `files` table (MDB_INTEGERKEY): native-endian size_t, as LMDB requires.
+    """
+    return int(file_id).to_bytes(8, sys.byteorder)
+
+
+def _cid_key(cid: int) -> bytes:
+    """
+    CID key: fixed-width 8-byte big-endian, so LMDB's byte order equals numeric order.
+    """
+    return int(cid).to_bytes(8, "big")
+
+
+def _is_cid(cid: int) -> bool:
+    """
+    True if `cid` can be in the index: CID keys are uint64 and RecordLocator stores the
+    CID as int64, so anything outside [0, 2**63) is simply not found.
+    """
+    return 0 <= cid < 1 << 63
+
+
+def _pl_page_key(cid_k: bytes, page_no: int) -> bytes:
+    """Posting list page key: cid key || page_no (uint32 big-endian)."""
+    return cid_k + page_no.to_bytes(4, "big")
+
+
 def _uuid_to_keyprefix(is_conformer: bool) -> bytes:
-    return b"F" if is_conformer else b"C"
+    """
+    Prefix of record-id keyed `records` entries: conformers, and compounds without a
+    CID (compounds with one are keyed by it, see _compound_key).
+    """
+    return b"F" if is_conformer else b"N"
+
+
+def _compound_key(cid: int) -> bytes:
+    """`records` key of the compound with this CID: b"C" || cid key."""
+    return b"C" + _cid_key(cid)
+
+
+# Record id: file_id (uint32 big-endian) || rec_no (uint32 big-endian)
+RECORD_ID_SIZE = 8
+
+
+def _make_record_id(file_id: int, rec_no: int) -> bytes:
+    """
+    Record id used in `records` keys and posting lists. file_id is assigned in build
+    order and rec_no counts up within a file, so ids are produced in ascending order.
+    """
+    return file_id.to_bytes(4, "big") + rec_no.to_bytes(4, "big")
 
 
-def _make_alid(kind: str, relpath: str, rec_no: int, primary_id: str) -> uuid.UUID:
+# ALID: the 9-byte `records` key, left-padded with zero bytes to a 16-byte UUID
+_ALID_PAD = bytes(16 - 1 - RECORD_ID_SIZE)
+
+
+def _alid_from_key(rec_key: bytes) -> bytes:
     """
-    Deterministic ALID:
-    - kind: "compound" or "conformer"
-    - relpath: relative file path inside indexed root
-    - rec_no: record order in file
-    - primary_id: CID or conformer_id if available else ""
+    ALID bytes of a record: deterministic (CID for compounds, file_id/rec_no otherwise)
+    and free to compute, no hashing per record.
     """
-    # Keep string stable; avoid absolute paths.
-    s = f"{kind}|{relpath}|{rec_no}|{primary_id}"
-    return uuid.uuid5(ALID_NAMESPACE, s)
-
-
-def _chunked(iterable: Iterable, chunk_size: int) -> Iterator[List]:
-    buf = []
-    for x in iterable:
-        buf.append(x)
-        if len(buf) >= chunk_size:
-            yield buf
-            buf = []
-    if buf:
-        yield buf
+    return _ALID_PAD + rec_key
+
+
+def _key_from_alid(alid: bytes) -> Optional[bytes]:
+    """`records` key encoded in an ALID, or None if it is not one of ours."""
+    pad, rec_key = alid[: len(_ALID_PAD)], alid[len(_ALID_PAD) :]
+    if pad != _ALID_PAD or rec_key[:1] not in (b"C", b"N", b"F"):
+        return None
+    return rec_key
+
+
+if sys.version_info >= (3, 12):
+    from itertools import batched as _batched
+
+    def _chunked(iterable: Iterable, chunk_size: int) -> Iterator[Tuple]:
+        return _batched(iterable, chunk_size)
+
+else:
+
+    def _chunked(iterable: Iterable, chunk_size: int) -> Iterator[Tuple]:
+        it = iter(iterable)
+        while batch := tuple(islice(it, chunk_size)):
+            yield batch
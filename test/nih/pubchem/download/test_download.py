@@ -9,12 +9,17 @@
 ### 
 ### Copyright (c) 2025 by AI Lingues, All Rights Reserved. 
 ********************************************************** '''
-import enum
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import os
 from pathlib import Path
 import time
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from typing import List
+from typing import List, Optional
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
 
 # 引入 rich 库用于进度显示
 from rich.progress import (
@@ -26,16 +31,175 @@ from rich.progress import (
 )
 
 
-from nih.pubchem.download import fetch_html_source, parse_html_content,download_worker
+import nih.pubchem.download.download as download
+from nih.pubchem.download import fetch_html_source, parse_html_content,download_files
+from nih.pubchem.download.download import TokenBucket, download_one, parse_rate
 from nih.pubchem.types import FileNode
-from nih.pubchem.utils import verify_md5
+from utils.md5_check import verify_md5
 
 
 # --- 配置区域 ---
-MAX_WORKERS = 8  # 最大并行进程数
+MAX_CONCURRENCY = 32  # 最大并发连接数
+LIMIT_RATE = "4M"  # 总带宽限速
 ERROR_LOG_FILE = "download_errors.txt"  # 错误记录文件
 
 
+# --- pytest: download_one / TokenBucket / parse_rate ---
+PAYLOAD = bytes(range(256)) * 64  # 16 KiB
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [("1024", 1024), ("500K", 500 << 10), ("2m", 2 << 20), (" 1.5G ", 1.5 * (1 << 30))],
+)
+def test_parse_rate(text, expected):
+    assert parse_rate(text) == expected
+
+
+@pytest.mark.parametrize("text", [None, ""])
+def test_parse_rate_unlimited(text):
+    assert parse_rate(text) is None
+
+
+def test_token_bucket_waits_for_refill():
+    async def run():
+        bucket = TokenBucket(rate=10_000, capacity=1_000)
+        t0 = time.monotonic()
+        await bucket.acquire(1_000)  # full bucket: no wait
+        t1 = time.monotonic()
+        await bucket.acquire(500)  # empty bucket: 500 / 10_000 s
+        return t1 - t0, time.monotonic() - t1
+
+    burst, wait = asyncio.run(run())
+    assert burst < 0.02
+    assert 0.04 <= wait < 0.5
+
+
+def test_token_bucket_chunk_larger_than_capacity():
+    async def run():
+        bucket = TokenBucket(rate=10_000, capacity=1_000)
+        t0 = time.monotonic()
+        await bucket.acquire(2_000)  # passes once the bucket is full, then owes 1_000
+        t1 = time.monotonic()
+        await bucket.acquire(500)  # pays the debt first: 1_500 / 10_000 s
+        return t1 - t0, time.monotonic() - t1
+
+    burst, wait = asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert burst < 0.02
+    assert 0.14 <= wait < 0.6
+
+
+LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+LAST_MODIFIED_TS = 1735689600
+
+
+def _app(
+    ignore_range: bool = False,
+    payload: bytes = PAYLOAD,
+    last_modified: str = LAST_MODIFIED,
+    statuses: Optional[list] = None,
+) -> web.Application:
+    async def handler(request: web.Request) -> web.Response:
+        headers = {"Last-Modified": last_modified}
+        if_range = request.headers.get("If-Range")
+        if ignore_range or not request.headers.get("Range") or if_range not in (None, last_modified):
+            resp = web.Response(body=payload, headers=headers)
+        elif (request.http_range.start or 0) >= len(payload):
+            resp = web.Response(status=416, headers=headers)
+        else:
+            resp = web.Response(status=206, body=payload[request.http_range.start :], headers=headers)
+        if statuses is not None:
+            statuses.append(resp.status)
+        return resp
+
+    app = web.Application()
+    app.router.add_get("/sdf/ok.sdf.gz", handler)
+    return app
+
+
+def _download(tmp_path: Path, name: str = "ok.sdf.gz", app: Optional[dict] = None, **kw):
+    async def run():
+        async with TestServer(_app(**(app or {}))) as server:
+            async with aiohttp.ClientSession() as session:
+                node = FileNode(name, name, "2025-01-01 00:00", "16K")
+                return await download_one(
+                    session, node, str(server.make_url("/sdf/")), str(tmp_path), **kw
+                )
+
+    return asyncio.run(run())
+
+
+def _local(tmp_path: Path, data: bytes, mtime: float = LAST_MODIFIED_TS) -> Path:
+    """A file left by an earlier download, stamped with that download's Last-Modified."""
+    fp = tmp_path / "ok.sdf.gz"
+    fp.write_bytes(data)
+    os.utime(fp, (mtime, mtime))
+    return fp
+
+
+def test_download_one_fresh(tmp_path):
+    ok, msg, url, node = _download(tmp_path)
+    assert (ok, msg) == (True, "Success")
+    assert url.endswith("/sdf/ok.sdf.gz")
+    assert (tmp_path / node.file_name).read_bytes() == PAYLOAD
+    assert os.path.getmtime(tmp_path / node.file_name) == LAST_MODIFIED_TS
+
+
+def test_download_one_resumes_partial_file(tmp_path):
+    fp = _local(tmp_path, PAYLOAD[:1000])
+    statuses = []
+    assert _download(tmp_path, app={"statuses": statuses})[0]
+    assert statuses == [206]
+    assert fp.read_bytes() == PAYLOAD
+
+
+def test_download_one_complete_file_is_success(tmp_path):
+    fp = _local(tmp_path, PAYLOAD)
+    statuses = []
+    assert _download(tmp_path, app={"statuses": statuses})[:2] == (True, "Success")
+    assert statuses == [416]
+    assert fp.read_bytes() == PAYLOAD
+
+
+@pytest.mark.parametrize("size", [len(PAYLOAD), len(PAYLOAD) - 1000])
+def test_download_one_refetches_changed_remote_file(tmp_path, size):
+    # same size or larger than the local copy, but newer: 206 / 416 would keep stale bytes
+    fp = _local(tmp_path, PAYLOAD[:size], mtime=LAST_MODIFIED_TS - 86400)
+    new_payload = PAYLOAD[::-1]
+    statuses = []
+    assert _download(tmp_path, app={"payload": new_payload, "statuses": statuses})[0]
+    assert statuses == [200]
+    assert fp.read_bytes() == new_payload
+    assert os.path.getmtime(fp) == LAST_MODIFIED_TS
+
+
+def test_download_one_rewrites_when_range_ignored(tmp_path):
+    fp = _local(tmp_path, b"stale")
+    assert _download(tmp_path, app={"ignore_range": True})[0]
+    assert fp.read_bytes() == PAYLOAD
+
+
+def test_download_one_rate_limited(tmp_path):
+    class CountingBucket(TokenBucket):
+        charged = 0
+
+        async def acquire(self, amount: int) -> None:
+            CountingBucket.charged += amount
+            await super().acquire(amount)
+
+    assert _download(tmp_path, limiter=CountingBucket(rate=1 << 30))[0]
+    assert CountingBucket.charged == len(PAYLOAD)
+    assert (tmp_path / "ok.sdf.gz").read_bytes() == PAYLOAD
+
+
+def test_download_one_gives_up_after_retries(tmp_path, monkeypatch):
+    monkeypatch.setattr(download, "RETRY_DELAY", 0)
+    ok, msg, url, node = _download(tmp_path, name="missing.sdf.gz", tries=2)
+    assert not ok
+    assert "404" in msg
+    assert not (tmp_path / "missing.sdf.gz").exists()
+
+
 # 5. [新增] 主控制逻辑
 def main():
     target_url = (
@@ -83,8 +247,8 @@ def main():
         TimeRemainingColumn(),
     ]
 
-    # 3. 开始多进程下载
-    # 使用 'spawn' 或 'fork' 取决于系统，ProcessPoolExecutor 会自动处理
+    # 3. 开始并发下载
+    # 单进程 asyncio 协程池, 所有文件共享同一个 keep-alive 连接池
 
     download_success_files:List[(FileNode,str)] = []
     with Progress(*progress_columns) as progress:
@@ -92,25 +256,29 @@ def main():
             "[green]Downloading...", total=total_should_download_files
         )
 
-        with ProcessPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            # 提交所有任务
-            # future_to_file 映射用于追踪哪个 future 对应哪个文件（如果需要的话，这里主要靠返回值）
-            futures = [
-                executor.submit(download_worker, node, target_url, save_path,'500K')
-                for node in should_file_list
-            ]
-
-            # as_completed 会在任意一个子进程结束时 yield 结果
-            for future in as_completed(futures):
-                success, msg,url, fnode = future.result()
-                download_success_files.append((fnode,url))
-                # 更新进度条 (前进 1)ll
-                progress.update(task_id, advance=1)
-
-                # 收集失败任务
-                if not success:
-                    print(f"failed:\t{fnode.file_name} | {url} | Reason: {msg}")
-                    failed_tasks.append(f"{fnode.file_name} | {url} | Reason: {msg}")
+        # 每个文件结束时回调 (在事件循环线程中执行)
+        def on_done(result):
+            success, msg,url, fnode = result
+            download_success_files.append((fnode,url))
+            # 更新进度条 (前进 1)
+            progress.update(task_id, advance=1)
+
+            # 收集失败任务
+            if not success:
+                print(f"failed:\t{fnode.file_name} | {url} | Reason: {msg}")
+                failed_tasks.append(f"{fnode.file_name} | {url} | Reason: {msg}")
+
+        # 限速为所有连接共享的总带宽 (原先为每个 wget 进程 500K)
+        asyncio.run(
+            download_files(
+                should_file_list,
+                target_url,
+                save_path,
+                limit_rate=LIMIT_RATE,
+                max_concurrency=MAX_CONCURRENCY,
+                on_done=on_done,
+            )
+        )
     
     # 4. 处理失败记录
     print("\n" + "=" * 40)
@@ -132,16 +300,22 @@ def main():
     failed_verify_files:List[str]=[]
     print("\n" + "=" * 40)
     print(f'[*] Starting verify {len(download_success_files)} downloaded files...')
+    verify_jobs = []
     for i, (fnode,url) in enumerate(download_success_files):            
         gz_file = Path(target_dir) / fnode.file_name
         md5_file =Path(f"{str(gz_file)}.md5")
         # 如果md文件不存在则不进行校验
         if not md5_file.exists():
             continue
-        result=verify_md5(gz_file,md5_file)
-        if not result:
-            failed_verify_files.append(fnode.file_name)
-        print(f"{i}:\t{result}{'✅' if result else '❌'}:\t {gz_file.name}")
+        verify_jobs.append((i, fnode, gz_file, md5_file))
+
+    # hashlib.file_digest 计算时释放 GIL, 多线程可并行校验多个文件
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = executor.map(lambda job: verify_md5(job[2], job[3]), verify_jobs)
+        for (i, fnode, gz_file, md5_file), result in zip(verify_jobs, results):
+            if not result:
+                failed_verify_files.append(fnode.file_name)
+            print(f"{i}:\t{result}{'✅' if result else '❌'}:\t {gz_file.name}")
 
     # 校验失败的文件名写入错误记录
     if len(failed_verify_files)>0:
@@ -0,0 +1,198 @@
+import json
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+import lmdb
+import pytest
+
+from nih.pubchem.index import sdf_index_builder as builder_mod
+from nih.pubchem.index._sdf_scan import make_field_table, scan_records
+from nih.pubchem.index.record_locator import RecordLocator
+from nih.pubchem.index.sdf_index import SDFIndex
+from nih.pubchem.index.sdf_index_builder import SDFIndexBuilder
+
+
+class SDFText:
+    """Builders for PubChem-style SDF text and trees (the `sdf` fixture)."""
+
+    MOLFILE = (
+        b"  -OEChem-01012600003D\n"
+        b"\n"
+        b"  2  1  0     0  0  0  0  0  0999 V2000\n"
+        b"    0.0000    0.0000    0.0000 O   0  0  0  0  0  0  0  0  0  0  0  0\n"
+        b"    1.0000    0.0000    0.0000 C   0  0  0  0  0  0  0  0  0  0  0  0\n"
+        b"  1  2  1  0  0  0  0\n"
+        b"M  END\n"
+    )
+
+    @classmethod
+    def record(cls, title: str, props: Dict[str, str], molfile: Optional[bytes] = None) -> bytes:
+        """One SDF record: title, molfile block, property blocks, $$$$."""
+        out = [title.encode() + b"\n", cls.MOLFILE if molfile is None else molfile]
+        for name, value in props.items():
+            out.append(f"> <{name}>\n{value}\n\n".encode())
+        out.append(b"$$$$\n")
+        return b"".join(out)
+
+    @classmethod
+    def compound(cls, cid: int, **extra: str) -> bytes:
+        return cls.record(str(cid), {"PUBCHEM_COMPOUND_CID": str(cid), **extra})
+
+    @classmethod
+    def conformer(cls, cid: int, conf_id: str) -> bytes:
+        return cls.record(
+            str(cid), {"PUBCHEM_COMPOUND_CID": str(cid), "PUBCHEM_CONFORMER_ID": conf_id}
+        )
+
+    @classmethod
+    def default_tree(cls) -> Dict[str, List[bytes]]:
+        """Two compound files (CIDs 1-20), one conformer file (3 conformers for CIDs 1-5)."""
+        return {
+            "Compound_000000001_000000010.sdf": [cls.compound(c) for c in range(1, 11)],
+            "Compound_000000011_000000020.sdf": [cls.compound(c) for c in range(11, 21)],
+            "Conformer3D_COMPOUND_CID_000000001.sdf": [
+                cls.conformer(c, f"{c:08d}{k:08d}") for c in range(1, 6) for k in range(1, 4)
+            ],
+        }
+
+    @staticmethod
+    def write_tree(root: Path, files: Dict[str, List[bytes]]) -> Path:
+        for relpath, records in files.items():
+            fp = root / relpath
+            fp.parent.mkdir(parents=True, exist_ok=True)
+            fp.write_bytes(b"".join(records))
+        return root
+
+
+def _build(root: Path, index_dir: Path, **kwargs) -> Dict:
+    kwargs = {"verbose": False, "workers": 1, **kwargs}
+    builder = SDFIndexBuilder(root, index_dir, **kwargs)
+    try:
+        return builder.build()
+    finally:
+        builder.idx.close()
+
+
+def _build_v1(root: Path, index_dir: Path) -> None:
+    """Write `root` in the original (schema_version 1) layout, as the first builder did."""
+    kinds: Dict[str, int] = {}
+    for names, bit in (
+        (builder_mod.CID_FIELD_CANDIDATES, builder_mod.FIELD_CID),
+        (builder_mod.PARENT_CID_FIELD_CANDIDATES, builder_mod.FIELD_PARENT_CID),
+        (builder_mod.CONFORMER_ID_FIELD_CANDIDATES, builder_mod.FIELD_CONFID),
+    ):
+        for name in names:
+            kinds[name] = kinds.get(name, 0) | bit
+    table = make_field_table(kinds)
+
+    env = lmdb.open(str(index_dir), map_size=1 << 26, max_dbs=32)
+    names = ("meta", "files", "files_rev", "records", "cid_to_compound",
+             "confid_to_conf", "cid_to_conformers_h", "cid_to_conformers_p")
+    db = {n: env.open_db(n.encode()) for n in names}
+    with env.begin(write=True) as txn:
+        meta = {"schema_version": 1, "root_dir": str(root), "pl_page_size": 4096}
+        totals = dict.fromkeys(("total_files", "total_records", "total_compound_records"), 0)
+        for file_id, fp in enumerate(sorted(root.rglob("*.sdf")), 1):
+            rel = fp.relative_to(root).as_posix()
+            txn.put(file_id.to_bytes(8, "little"), rel.encode(), db=db["files"])
+            txn.put(rel.encode(), file_id.to_bytes(8, "little"), db=db["files_rev"])
+            txn.put(b"file_id_counter", file_id.to_bytes(8, "little"), db=db["meta"])
+            is_conf = "conformer" in fp.name.lower()
+            buf = fp.read_bytes()
+            res = scan_records(buf, table, not is_conf)
+            totals["total_files"] += 1
+            totals["total_records"] += len(res.starts)
+            totals["total_compound_records"] += 0 if is_conf else len(res.starts)
+            rows = zip(res.starts, res.ends, res.cids, res.parent_cids, res.confid_offs, res.confid_lens)
+            for rec_no, (start, end, cid, parent, c_off, c_len) in enumerate(rows):
+                eff = cid if cid >= 0 or not is_conf else parent
+                alid = uuid.uuid5(uuid.NAMESPACE_URL, f"{rel}|{rec_no}").bytes
+                rec_key = (b"F" if is_conf else b"C") + alid
+                loc = RecordLocator(file_id, int(start), int(end), is_conf, None if eff < 0 else int(eff))
+                txn.put(rec_key, loc.to_bytes(), db=db["records"])
+                if not is_conf:
+                    if cid >= 0:
+                        txn.put(str(cid).encode(), rec_key, db=db["cid_to_compound"])
+                    continue
+                if c_off >= 0:
+                    txn.put(buf[c_off : c_off + c_len], rec_key, db=db["confid_to_conf"])
+                if eff >= 0:
+                    pk = str(eff).encode() + b"|0"
+                    blob = txn.get(pk, db=db["cid_to_conformers_p"]) or b""
+                    txn.put(pk, blob + alid, db=db["cid_to_conformers_p"])
+                    txn.put(str(eff).encode(), (1).to_bytes(4, "little"), db=db["cid_to_conformers_h"])
+        txn.put(b"meta_json", json.dumps({**meta, **totals}).encode(), db=db["meta"])
+    env.close()
+
+
+def _answers(idx: SDFIndex, root: Path, cids: Iterable[int], conf_ids: Iterable[str]) -> Dict:
+    seg = lambda hit: None if hit is None else idx.read_segment(root, hit.locator)
+    return {
+        "compound": {c: seg(idx.get_compound_by_cid(c)) for c in cids},
+        "conformer": {k: seg(idx.get_conformer_by_conformer_id(k)) for k in conf_ids},
+        "conformers_of": {c: [seg(h) for h in idx.iter_conformers_by_cid(c)] for c in cids},
+    }
+
+
+def _all_locators(idx: SDFIndex, cids: Optional[List[int]] = None):
+    locs = [idx.get_compound_by_cid(c).locator for c in (cids or range(1, 21))]
+    for c in range(1, 6):
+        locs.extend(hit.locator for hit in idx.iter_conformers_by_cid(c))
+    return locs
+
+
+@pytest.fixture
+def sdf():
+    return SDFText
+
+
+@pytest.fixture
+def build_index():
+    """build_index(root, index_dir, **builder_kwargs) -> build stats (quiet, in-process)."""
+    return _build
+
+
+@pytest.fixture
+def build_v1_index():
+    """build_v1_index(root, index_dir): the same tree in the schema_version 1 layout."""
+    return _build_v1
+
+
+@pytest.fixture
+def query():
+    """
+    query(index_dir, root, cids, conf_ids, extra=None): every lookup answer as raw SDF
+    text, comparable across index layouts; extra(idx) is stored under "extra".
+    """
+
+    def run(index_dir, root, cids, conf_ids, extra: Optional[Callable] = None) -> Dict:
+        idx = SDFIndex(index_dir)
+        try:
+            got = _answers(idx, root, cids, conf_ids)
+            if extra is not None:
+                got["extra"] = extra(idx)
+            return got
+        finally:
+            idx.close()
+
+    return run
+
+
+@pytest.fixture
+def all_locators():
+    """all_locators(idx, cids=None): locators of the default tree (35 records)."""
+    return _all_locators
+
+
+@pytest.fixture
+def sdf_root(tmp_path: Path) -> Path:
+    return SDFText.write_tree(tmp_path / "sdf", SDFText.default_tree())
+
+
+@pytest.fixture
+def index(sdf_root: Path, tmp_path: Path):
+    _build(sdf_root, tmp_path / "index")
+    idx = SDFIndex(tmp_path / "index")
+    yield idx
+    idx.close()
@@ -0,0 +1,67 @@
+import os
+
+import lmdb
+import pytest
+
+from nih.pubchem.index import get_compound as gc
+
+
+@pytest.fixture
+def index_dirs(sdf_root, tmp_path, build_index, monkeypatch):
+    """Three copies of the default index, with room for two open at a time."""
+    monkeypatch.setattr(gc, "INDEX_CACHE_SIZE", 2)
+    dirs = [tmp_path / f"index{i}" for i in range(3)]
+    for d in dirs:
+        build_index(sdf_root, d)
+    yield [str(d) for d in dirs]
+    gc.close_indexes()
+
+
+def test_open_index_reuses_and_closes_evicted(index_dirs, sdf_root, sdf):
+    a, b, c = index_dirs
+    idx_a = gc._open_index(a)
+    assert gc._open_index(a) is idx_a
+    idx_b = gc._open_index(b)
+    assert gc.get_compound([1], b, sdf_root) == {"1": sdf.compound(1)}
+    assert idx_b._mmap_cache
+    gc._open_index(a)  # a is now the most recently used
+    gc._open_index(c)
+    assert list(gc._index_cache) == [a, c]
+    with pytest.raises(lmdb.Error):
+        idx_b.env.stat()
+    assert not idx_b._mmap_cache
+    assert gc.get_compound([1], a, sdf_root) == {"1": sdf.compound(1)}
+
+    gc.close_indexes()
+    assert not gc._index_cache
+    with pytest.raises(lmdb.Error):
+        idx_a.env.stat()
+
+
+@pytest.fixture
+def segments():
+    return [b"rec %d\n$$$$\n" % i if i % 7 else b"" for i in range(3000)]
+
+
+def test_write_segments_back_to_back(tmp_path, segments, monkeypatch):
+    calls = []
+    writev = os.writev
+    monkeypatch.setattr(os, "writev", lambda fd, bufs: calls.append(len(bufs)) or writev(fd, bufs))
+    n = gc.write_segments(tmp_path / "out.sdf", iter(segments))
+    assert n == sum(1 for s in segments if s)
+    assert (tmp_path / "out.sdf").read_bytes() == b"".join(segments)
+    assert calls == [gc.IOV_MAX, gc.IOV_MAX, n - 2 * gc.IOV_MAX]
+
+
+def test_write_segments_finishes_short_writes(tmp_path, segments, monkeypatch):
+    # write only part of each vector, like a full pipe or an interrupted call
+    monkeypatch.setattr(os, "writev", lambda fd, bufs: os.write(fd, bufs[0][:3]))
+    write = os.write
+    monkeypatch.setattr(os, "write", lambda fd, data: write(fd, bytes(data[:5])))
+    gc.write_segments(tmp_path / "out.sdf", segments)
+    assert (tmp_path / "out.sdf").read_bytes() == b"".join(segments)
+
+
+def test_write_segments_nothing(tmp_path):
+    assert gc.write_segments(tmp_path / "out.sdf", [b"", b""]) == 0
+    assert (tmp_path / "out.sdf").read_bytes() == b""
@@ -0,0 +1,109 @@
+import json
+
+import lmdb
+import pytest
+
+from nih.pubchem.index import migrate
+from nih.pubchem.index.migrate import migrate_index
+from nih.pubchem.index.sdf_index import SDFIndex
+
+CIDS = range(0, 23)
+CONF_IDS = [f"{c:08d}{k:08d}" for c in range(1, 7) for k in range(0, 4)]
+
+
+def meta_json(index_dir) -> dict:
+    env = lmdb.open(str(index_dir), max_dbs=32, readonly=True)
+    try:
+        with env.begin(db=env.open_db(b"meta", create=False)) as txn:
+            return json.loads(txn.get(b"meta_json"))
+    finally:
+        env.close()
+
+
+def schema_version(index_dir) -> int:
+    return meta_json(index_dir)["schema_version"]
+
+
+@pytest.fixture
+def everything(query, all_locators):
+    """All lookups of the default tree, plus one coalesced read of every record."""
+
+    def run(index_dir, root):
+        batch = lambda idx: idx.read_segments_coalesced(root, all_locators(idx))
+        return query(index_dir, root, CIDS, CONF_IDS, extra=batch)
+
+    return run
+
+
+def test_v1_index_migrates_then_rebuilds(sdf, sdf_root, tmp_path, build_index, build_v1_index, everything):
+    build_v1_index(sdf_root, tmp_path / "index")
+    assert schema_version(tmp_path / "index") == 1
+    assert migrate_index(tmp_path / "index") == SDFIndex.SCHEMA_VERSION
+    assert schema_version(tmp_path / "index") == SDFIndex.SCHEMA_VERSION
+    # already current: nothing to do
+    assert migrate_index(tmp_path / "index") == SDFIndex.SCHEMA_VERSION
+
+    build_index(sdf_root, tmp_path / "fresh")
+    expected = everything(tmp_path / "fresh", sdf_root)
+    assert everything(tmp_path / "index", sdf_root) == expected
+    assert expected["compound"][20] == sdf.compound(20)
+
+    # the migrated index is a normal build target
+    build_index(sdf_root, tmp_path / "index")
+    assert everything(tmp_path / "index", sdf_root) == expected
+
+
+@pytest.mark.parametrize("batch", [1, 2, 7])
+def test_migration_in_small_batches(sdf_root, tmp_path, build_index, build_v1_index, everything, monkeypatch, batch):
+    monkeypatch.setattr(migrate, "MIGRATE_BATCH", batch)
+    build_v1_index(sdf_root, tmp_path / "index")
+    migrate_index(tmp_path / "index")
+    assert "migration" not in meta_json(tmp_path / "index")
+    build_index(sdf_root, tmp_path / "fresh")
+    assert everything(tmp_path / "index", sdf_root) == everything(tmp_path / "fresh", sdf_root)
+
+
+# 2 -> 3 rewrites the small files table in one txn
+@pytest.mark.parametrize("version", [1, 3, 4, 5])
+def test_interrupted_migration_resumes(sdf_root, tmp_path, build_index, build_v1_index, everything, monkeypatch, version):
+    monkeypatch.setattr(migrate, "MIGRATE_BATCH", 3)
+    step = migrate.MIGRATIONS[version]
+    calls = []
+
+    def crash_on_second_batch(env, txn, state):
+        calls.append(dict(state))
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return step(env, txn, state)
+
+    monkeypatch.setitem(migrate.MIGRATIONS, version, crash_on_second_batch)
+    build_v1_index(sdf_root, tmp_path / "index")
+    with pytest.raises(KeyboardInterrupt):
+        migrate_index(tmp_path / "index")
+    assert schema_version(tmp_path / "index") == version
+    with pytest.raises(RuntimeError, match="schema_version"):
+        SDFIndex(tmp_path / "index")
+
+    # the crashed batch was rolled back: the rerun picks up where the first batch ended
+    monkeypatch.setitem(migrate.MIGRATIONS, version, step)
+    assert migrate_index(tmp_path / "index") == SDFIndex.SCHEMA_VERSION
+    build_index(sdf_root, tmp_path / "fresh")
+    assert everything(tmp_path / "index", sdf_root) == everything(tmp_path / "fresh", sdf_root)
+
+
+def test_old_index_can_be_rebuilt_without_migrating(sdf_root, tmp_path, build_index, build_v1_index, everything):
+    build_v1_index(sdf_root, tmp_path / "index")
+    with pytest.raises(RuntimeError, match="schema_version=1"):
+        SDFIndex(tmp_path / "index")
+
+    build_index(sdf_root, tmp_path / "index")
+    assert schema_version(tmp_path / "index") == SDFIndex.SCHEMA_VERSION
+    build_index(sdf_root, tmp_path / "fresh")
+    assert everything(tmp_path / "index", sdf_root) == everything(tmp_path / "fresh", sdf_root)
+
+    # the v1-only tables and layouts are gone, not just shadowed
+    env = lmdb.open(str(tmp_path / "index"), max_dbs=32, readonly=True)
+    with env.begin() as txn:
+        names = set(txn.cursor().iternext(values=False))
+    env.close()
+    assert b"cid_to_compound" not in names
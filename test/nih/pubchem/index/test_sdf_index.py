@@ -0,0 +1,222 @@
+import gzip
+import mmap
+import os
+from pathlib import Path
+
+import pytest
+
+import nih.pubchem.index.sdf_index as sdf_index
+import nih.pubchem.index.sdf_index_builder as sdf_index_builder
+from utils import gzip_io
+
+
+def test_read_segments_batch_matches_read_segment(index, sdf_root, all_locators):
+    locs = all_locators(index)
+    assert len(locs) == 35
+    locs = locs[::-1] + locs[:3]  # out of file order, with repeats
+    expected = [index.read_segment(sdf_root, loc) for loc in locs]
+    assert index.read_segments_batch(sdf_root, locs) == expected
+
+
+@pytest.mark.skipif(sdf_index.liburing is None, reason="liburing not installed")
+def test_read_segments_batch_without_fixed_buffers(index, sdf_root, monkeypatch, all_locators):
+    def refuse(*args):
+        raise OSError(12, "Cannot allocate memory")
+
+    monkeypatch.setattr(sdf_index.liburing, "io_uring_register_buffers", refuse)
+    locs = all_locators(index)
+    expected = [index.read_segment(sdf_root, loc) for loc in locs]
+    assert index.read_segments_batch(sdf_root, locs) == expected
+
+
+@pytest.mark.skipif(sdf_index.liburing is None, reason="liburing not installed")
+def test_read_segments_batch_falls_back_without_ring(index, sdf_root, monkeypatch, all_locators):
+    def refuse(*args):
+        raise OSError(1, "Operation not permitted")
+
+    monkeypatch.setattr(sdf_index.liburing, "io_uring_queue_init", refuse)
+    locs = all_locators(index)
+    expected = [index.read_segment(sdf_root, loc) for loc in locs]
+    assert index.read_segments_batch(sdf_root, locs) == expected
+
+
+@pytest.mark.parametrize("cid", [-1, 0, 1 << 63, 1 << 64, 10**30])
+def test_cid_lookup_out_of_range_is_missing(index, cid):
+    assert index.get_compound_by_cid(cid) is None
+    assert list(index.batch_get_compounds_by_cid([cid, 3])) == [
+        (cid, None),
+        (3, index.get_compound_by_cid(3)),
+    ]
+    assert list(index.iter_conformers_by_cid(cid)) == []
+    index.prefetch_compounds([cid, 3])
+    assert index.get_compound_by_cid(cid) is None
+    assert index.get_compound_by_cid(3).locator.cid == 3
+
+
+@pytest.mark.parametrize("max_span", [sdf_index.COALESCE_MAX_SPAN, 1, 500, 2000])
+def test_read_segments_coalesced_matches_read_segment(index, sdf_root, max_span, all_locators):
+    locs = all_locators(index)
+    locs = locs[::-1] + locs[:3]
+    expected = [index.read_segment(sdf_root, loc) for loc in locs]
+    assert index.read_segments_coalesced(sdf_root, locs, max_span=max_span) == expected
+
+
+def test_batch_reads_of_nothing(index, sdf_root, all_locators):
+    assert index.read_segments_batch(sdf_root, []) == []
+    assert index.read_segments_coalesced(sdf_root, []) == []
+
+
+@pytest.mark.skipif(not hasattr(os, "posix_fadvise"), reason="no posix_fadvise")
+def test_read_segments_coalesced_advises_every_run_first(index, sdf_root, all_locators, monkeypatch):
+    calls = []
+    pread = os.pread
+    monkeypatch.setattr(os, "posix_fadvise", lambda fd, off, n, advice: calls.append(("advise", off, n)))
+    monkeypatch.setattr(os, "pread", lambda fd, n, off: calls.append(("read", off, n)) or pread(fd, n, off))
+    locs = all_locators(index)
+    assert index.read_segments_coalesced(sdf_root, locs, max_span=500) == [
+        index.read_segment(sdf_root, loc) for loc in locs
+    ]
+    advised = [c[1:] for c in calls if c[0] == "advise"]
+    assert len(advised) > 1
+    assert calls[: len(advised)] == [("advise", *r) for r in advised]
+    assert [c[1:] for c in calls if c[0] == "read"] == advised
+
+
+class _MadviseSpy:
+    def __init__(self, mm, calls):
+        self.mm, self.calls = mm, calls
+
+    def madvise(self, *args):
+        self.calls.append(args)
+        self.mm.madvise(*args)
+
+
+@pytest.mark.skipif(sdf_index.SDFIndex.BATCH_MMAP_ADVICE is None, reason="no MADV_WILLNEED")
+def test_advise_segments_covers_each_run(index, sdf_root, all_locators, monkeypatch):
+    calls = []
+    get_mmap = index._get_mmap
+    monkeypatch.setattr(index, "_get_mmap", lambda root, file_id: _MadviseSpy(get_mmap(root, file_id), calls))
+    locs = all_locators(index)
+    index.advise_segments(sdf_root, locs[::-1])
+    # the default tree's files are smaller than a page: one call per file
+    files = {loc.file_id for loc in locs}
+    assert len(calls) == len(files)
+    for advice, page, length in calls:
+        assert advice == index.BATCH_MMAP_ADVICE and page % mmap.PAGESIZE == 0
+    for file_id in files:
+        in_file = [loc for loc in locs if loc.file_id == file_id]
+        assert (index.BATCH_MMAP_ADVICE, 0, max(loc.end for loc in in_file)) in calls
+
+
+@pytest.mark.skipif(sdf_index.SDFIndex.BATCH_MMAP_ADVICE is None, reason="no MADV_WILLNEED")
+def test_advise_segments_splits_records_pages_apart(tmp_path, sdf, build_index, monkeypatch):
+    pad = "x" * (2 * mmap.PAGESIZE)
+    root = sdf.write_tree(tmp_path / "sdf", {"Compound_a.sdf": [sdf.compound(c, TAG=pad) for c in (1, 2, 3)]})
+    build_index(root, tmp_path / "index")
+    idx = sdf_index.SDFIndex(tmp_path / "index")
+    try:
+        calls = []
+        get_mmap = idx._get_mmap
+        monkeypatch.setattr(idx, "_get_mmap", lambda r, file_id: _MadviseSpy(get_mmap(r, file_id), calls))
+        locs = [idx.get_compound_by_cid(c).locator for c in (3, 1)]
+        idx.advise_segments(root, locs)
+        assert [(page, length) for _, page, length in calls] == [
+            (loc.start - loc.start % mmap.PAGESIZE, loc.end - loc.start + loc.start % mmap.PAGESIZE)
+            for loc in sorted(locs, key=lambda loc: loc.start)
+        ]
+    finally:
+        idx.close()
+
+
+@pytest.mark.skipif(gzip_io._indexed_gzip is None, reason="indexed_gzip not installed")
+@pytest.mark.parametrize("sidecar", [True, False], ids=["gzi", "no-gzi"])
+def test_read_segment_gz_matches_read_segment(tmp_path, sdf, build_index, sidecar):
+    # several MiB per file, so reads land past the first seek points
+    pad = "".join(f"{i:07d}" for i in range(2000))
+    files = {
+        "Compound_a.sdf": [sdf.compound(c, TAG=pad) for c in range(1, 301)],
+        "sub/Compound_b.sdf": [sdf.compound(c, TAG=pad) for c in range(301, 311)],
+    }
+    root = sdf.write_tree(tmp_path / "sdf", files)
+    build_index(root, tmp_path / "index")
+    for name in files:
+        fp = root / name
+        fp.with_name(fp.name + ".gz").write_bytes(gzip.compress(fp.read_bytes(), compresslevel=1))
+        if sidecar:
+            assert gzip_io.build_gzip_index(f"{fp}.gz") == Path(f"{fp}.gz.gzi")
+    idx = sdf_index.SDFIndex(tmp_path / "index")
+    try:
+        locs = [idx.get_compound_by_cid(c).locator for c in (310, 1, 300, 150, 305, 2)]
+        expected = [idx.read_segment(root, loc) for loc in locs]
+        for name in files:
+            (root / name).unlink()  # only the .gz remains
+        assert [idx.read_segment_gz(root, loc) for loc in locs] == expected
+        assert len(idx._gz_cache) == 2
+    finally:
+        idx.close()
+
+
+class _NoLMDB:
+    def begin(self, *args, **kwargs):
+        raise AssertionError("LMDB touched")
+
+
+def test_prefetch_all_compounds_answers_from_memory(index, sdf_root, monkeypatch):
+    expected = {c: index.get_compound_by_cid(c) for c in range(0, 23)}
+    assert index.prefetch_compounds() == 20
+    monkeypatch.setattr(index, "env", _NoLMDB())
+    # repeated and out-of-order lookups, including misses on either side of the range
+    for c in [5, 5, 1, 20, 0, 21, 22, 13, 13]:
+        assert index.get_compound_by_cid(c) == expected[c]
+    assert index.get_compound_by_cid(7).locator.cid == 7
+
+
+def test_prefetch_subset_falls_back_for_other_cids(index, sdf_root, monkeypatch):
+    expected = {c: index.get_compound_by_cid(c) for c in range(1, 22)}
+    assert index.prefetch_compounds([9, 3, 3, "4", 21]) == 3
+    env = index.env
+    monkeypatch.setattr(index, "env", _NoLMDB())
+    assert [index.get_compound_by_cid(c) for c in (3, 4, 9)] == [expected[3], expected[4], expected[9]]
+    monkeypatch.setattr(index, "env", env)
+    for c in (1, 10, 20, 21):
+        assert index.get_compound_by_cid(c) == expected[c]
+    assert index.read_segment(sdf_root, index.get_compound_by_cid(9).locator).startswith(b"9\n")
+
+
+@pytest.fixture
+def paged_index(tmp_path, sdf, build_index, monkeypatch):
+    """CID 1 with 7 conformers on pages of 3, CID 2 with one."""
+    monkeypatch.setattr(sdf_index_builder, "PL_PAGE_SIZE", 3)
+    confs = [sdf.conformer(1, f"1-{k}") for k in range(7)] + [sdf.conformer(2, "2-0")]
+    root = sdf.write_tree(tmp_path / "sdf", {"Conformer3D_a.sdf": confs})
+    build_index(root, tmp_path / "index")
+    idx = sdf_index.SDFIndex(tmp_path / "index")
+    yield idx, root, confs
+    idx.close()
+
+
+def test_iter_conformers_resume_from(paged_index):
+    idx, root, confs = paged_index
+    with idx.env.begin(db=idx.db_cid2conf_h) as txn:
+        assert int.from_bytes(txn.get(sdf_index._cid_key(1)), "little") == 3
+    full = list(idx.iter_conformers_by_cid(1))
+    assert [idx.read_segment(root, h.locator) for h in full] == confs[:7]
+    only = list(idx.iter_conformers_by_cid(2))
+
+    taken = []
+    for n in (2, 1, 3):  # stops inside the first page, on its boundary, across pages
+        stream = idx.iter_conformers_by_cid(1, resume_from=True)
+        taken += [next(stream) for _ in range(n)]
+        stream.close()
+    assert taken == full[:6]
+    # a plain walk neither uses nor moves the resume position; positions are per CID
+    assert list(idx.iter_conformers_by_cid(1)) == full
+    assert list(idx.iter_conformers_by_cid(2, resume_from=True)) == only
+    assert list(idx.iter_conformers_by_cid(1, resume_from=True)) == full[6:]
+    assert list(idx.iter_conformers_by_cid(1, resume_from=True)) == []
+
+    idx.reset_conformer_cursor(1)
+    assert list(idx.iter_conformers_by_cid(1, resume_from=True)) == full
+    assert list(idx.iter_conformers_by_cid(2, resume_from=True)) == []
+    idx.reset_conformer_cursor()
+    assert list(idx.iter_conformers_by_cid(2, resume_from=True)) == only
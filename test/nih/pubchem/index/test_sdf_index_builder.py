@@ -0,0 +1,146 @@
+import pytest
+
+from nih.pubchem.index import sdf_index_builder
+from nih.pubchem.index.migrate import migrate_index
+from nih.pubchem.index.sdf_index import SDFIndex
+from nih.pubchem.index.sdf_index_builder import SDFIndexBuilder
+
+
+@pytest.fixture
+def duplicates(sdf):
+    """CID 2 appears in both files, CID 3 twice in the first; conformer id 00000001 twice."""
+    return {
+        "Compound_a.sdf": [sdf.compound(1), sdf.compound(2), sdf.compound(3), sdf.compound(3, TAG="second")],
+        "Compound_b.sdf": [sdf.compound(2, TAG="last"), sdf.record("no cid", {"TAG": "x"})],
+        "Conformer3D_a.sdf": [sdf.conformer(1, "00000001"), sdf.conformer(2, "00000001")],
+    }
+
+
+@pytest.fixture(params=[100_000, 1], ids=["one-txn", "txn-per-file"])
+def commit_every(request, monkeypatch):
+    monkeypatch.setattr(sdf_index_builder, "COMMIT_EVERY_RECORDS", request.param)
+
+
+def test_duplicate_cid_last_wins(tmp_path, commit_every, sdf, duplicates, build_index, query):
+    root = sdf.write_tree(tmp_path / "sdf", duplicates)
+    build_index(root, tmp_path / "index")
+    got = query(tmp_path / "index", root, [1, 2, 3], ["00000001"])
+    assert got["compound"][2] == duplicates["Compound_b.sdf"][0]
+    assert got["compound"][3] == duplicates["Compound_a.sdf"][3]
+    assert got["conformer"]["00000001"] == duplicates["Conformer3D_a.sdf"][1]
+    assert got["conformers_of"] == {1: [sdf.conformer(1, "00000001")], 2: [sdf.conformer(2, "00000001")], 3: []}
+
+
+def stored_records(index_dir):
+    """`records` keys per prefix (C / N / F), as stored."""
+    idx = SDFIndex(index_dir)
+    try:
+        with idx.env.begin(db=idx.db_records) as txn:
+            keys = list(txn.cursor().iternext(values=False))
+    finally:
+        idx.close()
+    return {p: sum(k[:1] == p for k in keys) for p in (b"C", b"N", b"F")}
+
+
+def test_duplicate_cid_counts_only_stored_records(tmp_path, commit_every, sdf, duplicates, build_index, capsys):
+    root = sdf.write_tree(tmp_path / "sdf", duplicates)
+    meta = build_index(root, tmp_path / "index")
+    stored = stored_records(tmp_path / "index")
+    assert stored == {b"C": 3, b"N": 1, b"F": 2}
+    assert meta["duplicate_cid_records_dropped"] == 2
+    assert meta["total_compound_records"] == stored[b"C"] + stored[b"N"] == 4
+    assert meta["total_records"] == sum(stored.values()) == 6
+    assert meta["total_conformer_records"] == 2
+
+    build_index(root, tmp_path / "verbose", verbose=True)
+    assert "2 compound records dropped" in capsys.readouterr().out
+
+
+def test_migrated_duplicates_match_fresh_build(tmp_path, sdf, duplicates, build_index, build_v1_index, query):
+    root = sdf.write_tree(tmp_path / "sdf", duplicates)
+    build_v1_index(root, tmp_path / "v1")
+    assert migrate_index(tmp_path / "v1") == SDFIndex.SCHEMA_VERSION
+    fresh = build_index(root, tmp_path / "fresh")
+    args = (root, [1, 2, 3], ["00000001"])
+    assert query(tmp_path / "v1", *args) == query(tmp_path / "fresh", *args)
+    assert stored_records(tmp_path / "v1") == stored_records(tmp_path / "fresh")
+
+    idx = SDFIndex(tmp_path / "v1")
+    meta = idx.get_meta()
+    idx.close()
+    for key in ("duplicate_cid_records_dropped", "total_records", "total_compound_records"):
+        assert meta[key] == fresh[key]
+
+
+def test_rebuild_after_change_drops_stale_entries(tmp_path, commit_every, sdf, build_index, query):
+    root = sdf.write_tree(
+        tmp_path / "sdf",
+        {
+            "Compound_a.sdf": [sdf.compound(c) for c in range(1, 6)],
+            "Conformer3D_a.sdf": [sdf.conformer(c, f"{c:08d}") for c in range(1, 4)],
+        },
+    )
+    build_index(root, tmp_path / "index")
+    # records shift, CIDs 4-5 and conformer 3 disappear, CID 6 is new
+    changed = {
+        "Compound_a.sdf": [sdf.compound(c, TAG="v2") for c in (6, 1, 2, 3)],
+        "Conformer3D_a.sdf": [sdf.conformer(c, f"{c:08d}") for c in (2, 1)],
+    }
+    sdf.write_tree(root, changed)
+    build_index(root, tmp_path / "index")
+    build_index(root, tmp_path / "fresh")
+
+    cids, conf_ids = range(1, 7), [f"{c:08d}" for c in range(1, 4)]
+    got = query(tmp_path / "index", root, cids, conf_ids)
+    assert got == query(tmp_path / "fresh", root, cids, conf_ids)
+    assert got["compound"][4] is None and got["compound"][5] is None
+    assert got["compound"][1] == changed["Compound_a.sdf"][1]
+    assert got["conformer"]["00000003"] is None
+    assert got["conformers_of"][1] == [sdf.conformer(1, "00000001")]
+    assert got["conformers_of"][3] == []
+
+
+def test_builder_reused_after_files_table_reset(sdf, sdf_root, tmp_path, query):
+    builder = SDFIndexBuilder(sdf_root, tmp_path / "index", verbose=False, workers=1)
+    try:
+        builder.build()
+        # file ids handed out by the first build no longer exist
+        with builder.idx.env.begin(write=True) as txn:
+            txn.drop(builder.idx.db_files, delete=False)
+            txn.drop(builder.idx.db_files_rev, delete=False)
+            txn.put(b"file_id_counter", (100).to_bytes(8, "little"), db=builder.idx.db_meta)
+        builder.build()
+    finally:
+        builder.idx.close()
+    got = query(tmp_path / "index", sdf_root, [1, 20], ["0000000100000001"])
+    assert got["compound"] == {1: sdf.compound(1), 20: sdf.compound(20)}
+    assert got["conformer"]["0000000100000001"] == sdf.conformer(1, "0000000100000001")
+
+
+def dump_tables(index_dir):
+    """Every named table's entries; meta_json without the build time."""
+    idx = SDFIndex(index_dir)
+    try:
+        out = {}
+        with idx.env.begin() as txn:
+            for name, _ in txn.cursor():
+                db = idx.env.open_db(name, txn=txn)
+                out[name] = [(k, v) for k, v in txn.cursor(db=db) if k != b"meta_json"]
+        meta = idx.get_meta()
+    finally:
+        idx.close()
+    meta.pop("built_at")
+    return out, meta
+
+
+@pytest.mark.parametrize("prefetch", [1, 2])
+def test_parallel_build_matches_serial(tmp_path, commit_every, sdf, duplicates, build_index, monkeypatch, prefetch):
+    monkeypatch.setattr(sdf_index_builder, "SCAN_PREFETCH_PER_WORKER", prefetch)
+    files = {**sdf.default_tree(), **duplicates}
+    files.update({f"sub/Compound_{i:03d}.sdf": [sdf.compound(100 + i), sdf.compound(2)] for i in range(8)})
+    root = sdf.write_tree(tmp_path / "sdf", files)
+    serial = build_index(root, tmp_path / "serial", workers=1)
+    parallel = build_index(root, tmp_path / "parallel", workers=3)
+    assert serial["total_files"] == len(files)
+    assert dump_tables(tmp_path / "parallel") == dump_tables(tmp_path / "serial")
+    assert parallel["duplicate_cid_records_dropped"] == serial["duplicate_cid_records_dropped"] > 0
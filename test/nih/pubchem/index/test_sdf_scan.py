@@ -0,0 +1,148 @@
+import pytest
+
+import nih.pubchem.index._sdf_scan as sdf_scan
+
+KINDS = {
+    "PUBCHEM_COMPOUND_CID": sdf_scan.FIELD_CID | sdf_scan.FIELD_PARENT_CID,
+    "PUBCHEM_CONFORMER_ID": sdf_scan.FIELD_CONFID,
+}
+
+
+@pytest.fixture(params=["c", "numba", "python"])
+def kernel(request, monkeypatch):
+    """scan_records restricted to one kernel."""
+    if request.param == "c":
+        if sdf_scan._lib is None:
+            pytest.skip("C scanner not built (python -m nih.pubchem.index._sdf_scan_build)")
+        monkeypatch.setattr(sdf_scan, "_scan_kernel_jit", None)
+    elif request.param == "numba":
+        if sdf_scan._scan_kernel_jit is None:
+            pytest.skip("numba not installed")
+        monkeypatch.setattr(sdf_scan, "_lib", None)
+    else:
+        monkeypatch.setattr(sdf_scan, "_lib", None)
+        monkeypatch.setattr(sdf_scan, "_scan_kernel_jit", None)
+    return request.param
+
+
+def scan(buf: bytes, compound_file: bool = True, eof: bool = True):
+    return sdf_scan.scan_records(buf, sdf_scan.make_field_table(KINDS), compound_file, eof)
+
+
+@pytest.mark.parametrize("terminator", [b"  $$$$\n", b"\t$$$$\r\n", b"$$$$  \n"])
+def test_indented_terminator_ends_record(kernel, terminator, sdf):
+    first = sdf.compound(5)[: -len(b"$$$$\n")] + terminator
+    buf = first + sdf.compound(6)
+    res = scan(buf)
+    assert res.starts.tolist() == [0, len(first)]
+    assert res.ends.tolist() == [len(first), len(buf)]
+    assert res.cids.tolist() == [5, 6]
+    assert res.consumed == len(buf)
+
+
+def test_indented_terminator_right_after_title(kernel, sdf):
+    buf = b"7\n  $$$$\n" + sdf.compound(8)
+    assert scan(buf).cids.tolist() == [7, 8]
+
+
+KERNELS = {
+    "c": {"_scan_kernel_jit": None},
+    "numba": {"_lib": None},
+    "python": {"_lib": None, "_scan_kernel_jit": None},
+}
+
+
+def scan_all(monkeypatch, buf: bytes, compound_file: bool = True, eof: bool = True):
+    """Scan `buf` with every available kernel: {kernel: (consumed, rows)}."""
+    out = {}
+    for name, off in KERNELS.items():
+        if name == "c" and sdf_scan._lib is None:
+            continue
+        if name == "numba" and sdf_scan._scan_kernel_jit is None:
+            continue
+        with monkeypatch.context() as m:
+            for attr, value in off.items():
+                m.setattr(sdf_scan, attr, value)
+            res = scan(buf, compound_file, eof)
+        cols = (res.starts, res.ends, res.cids, res.parent_cids, res.confid_offs, res.confid_lens)
+        out[name] = (res.consumed, [tuple(map(int, row)) for row in zip(*cols)])
+    return out
+
+
+def crlf(record: bytes) -> bytes:
+    return record.replace(b"\n", b"\r\n")
+
+
+# name -> builder over the `sdf` fixture
+EDGE_CASES = {
+    "crlf": lambda s: crlf(s.compound(1)) + crlf(s.compound(2)),
+    "no-final-newline": lambda s: s.compound(1) + s.compound(2)[:-1],
+    "lowercase-padded-name": lambda s: s.record("x", {" pubchem_compound_cid ": "3"}),
+    "value-after-blank-lines": lambda s: s.compound(4)[:-5] + b"> <CID>\n\n  5  \n\n$$$$\n",
+    "title-beats-property": lambda s: s.record("6", {"PUBCHEM_COMPOUND_CID": "7"}),
+    "non-numeric-title": lambda s: s.record("aspirin", {"PUBCHEM_COMPOUND_CID": "8"}),
+    "too-many-digits": lambda s: s.record("1" * 19, {"PUBCHEM_COMPOUND_CID": "9" * 19}),
+    "signed-cid": lambda s: s.record("-10", {"PUBCHEM_COMPOUND_CID": "+10"}),
+    "empty-value": lambda s: s.record("x", {"PUBCHEM_COMPOUND_CID": "", "PUBCHEM_CONFORMER_ID": ""}),
+    "no-properties": lambda s: b"11\n" + s.compound(11)[3:].split(b"> <")[0] + b"$$$$\n",
+    "gt-in-molfile": lambda s: b"12\n>not a header\n" + s.compound(12)[3:],
+    "empty-name": lambda s: s.record("13", {"": "14"}),
+    "trailing-garbage": lambda s: s.compound(15) + b"16\n  partial record",
+}
+
+
+@pytest.mark.parametrize("compound_file", [True, False], ids=["compound", "conformer"])
+@pytest.mark.parametrize("case", sorted(EDGE_CASES))
+def test_kernels_agree_on_edge_cases(monkeypatch, sdf, case, compound_file):
+    buf = EDGE_CASES[case](sdf)
+    for eof in (True, False):
+        results = scan_all(monkeypatch, buf, compound_file, eof)
+        assert len(set(map(repr, results.values()))) == 1, results
+
+
+def test_edge_case_values(monkeypatch, sdf):
+    def cids(case, compound_file=True):
+        return [row[2] for row in scan_all(monkeypatch, EDGE_CASES[case](sdf), compound_file)["python"][1]]
+
+    assert cids("crlf") == [1, 2]
+    assert cids("no-final-newline") == [1, 2]
+    assert cids("lowercase-padded-name") == [3]
+    assert cids("title-beats-property") == [6]
+    assert cids("title-beats-property", compound_file=False) == [7]
+    assert cids("non-numeric-title") == [8]
+    assert cids("too-many-digits") == [-1]
+    assert cids("signed-cid") == [-1]
+    assert cids("gt-in-molfile") == [12]
+    assert cids("trailing-garbage") == [15]
+
+
+def test_conformer_ids_and_parent_cids_agree(monkeypatch, sdf):
+    buf = b"".join(sdf.conformer(c, f"{c:08d}{k:08d}") for c in (1, 2) for k in (1, 2))
+    buf += sdf.record("3", {"PUBCHEM_COMPOUND_CID": "3", "PUBCHEM_CONFORMER_ID": "  0000000300000001 "})
+    results = scan_all(monkeypatch, buf, compound_file=False)
+    assert len(set(map(repr, results.values()))) == 1
+    consumed, rows = results["python"]
+    assert consumed == len(buf)
+    assert [r[3] for r in rows] == [1, 1, 2, 2, 3]
+    assert [buf[r[4] : r[4] + r[5]] for r in rows][-1] == b"0000000300000001"
+
+
+@pytest.mark.parametrize("cut", [0, 7, 40, -1])
+def test_partial_buffer_resumes_at_record_boundary(monkeypatch, sdf, cut):
+    buf = sdf.compound(1) + sdf.compound(2) + sdf.compound(3)
+    head = buf[: len(buf) - len(sdf.compound(3)) + cut] if cut >= 0 else buf[:-1]
+    results = scan_all(monkeypatch, head, eof=False)
+    assert len(set(map(repr, results.values()))) == 1
+    consumed, rows = results["python"]
+    assert consumed == len(sdf.compound(1)) * 2
+    assert [r[2] for r in rows] == [1, 2]
+
+
+def test_scan_batch_resume(monkeypatch, sdf):
+    monkeypatch.setattr(sdf_scan, "SCAN_BATCH", 2)
+    buf = b"".join(sdf.compound(c) for c in range(1, 8))
+    results = scan_all(monkeypatch, buf)
+    assert len(set(map(repr, results.values()))) == 1
+    consumed, rows = results["python"]
+    assert consumed == len(buf)
+    assert [r[2] for r in rows] == list(range(1, 8))
@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+from utils.files import get_files_by_extension
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for rel in ("a.gz", "b.gz", "b.gz.md5", "skip.gz", "c.txt", "sub/d.gz", "sub/deeper/e.gz"):
+        fp = tmp_path / rel
+        fp.parent.mkdir(parents=True, exist_ok=True)
+        fp.write_bytes(b"")
+    (tmp_path / "dir.gz").mkdir()  # a directory with a matching name
+    os.symlink(tmp_path / "a.gz", tmp_path / "link.gz")
+    return tmp_path
+
+
+def names(root, files):
+    return sorted(os.path.relpath(f, root) for f in files)
+
+
+@pytest.mark.parametrize("extension", [".gz", "gz"])
+def test_recursive(tree, extension):
+    files = get_files_by_extension(str(tree), extension, exclude_name="skip.gz")
+    assert all(os.path.isabs(f) for f in files)
+    assert names(tree, files) == ["a.gz", "b.gz", "link.gz", "sub/d.gz", "sub/deeper/e.gz"]
+
+
+def test_non_recursive_lists_regular_files_only(tree):
+    files = get_files_by_extension(str(tree), ".gz", exclude_name="skip.gz", recursive=False)
+    assert all(os.path.isabs(f) for f in files)
+    # no subdirectories, no directory named *.gz, no symlinks
+    assert names(tree, files) == ["a.gz", "b.gz"]
+
+
+def test_not_a_directory(tmp_path, capsys):
+    assert get_files_by_extension(str(tmp_path / "missing"), ".gz", recursive=False) == []
+    assert "missing" in capsys.readouterr().out
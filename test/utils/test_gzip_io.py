@@ -0,0 +1,105 @@
+import gzip
+import os
+import subprocess
+import sys
+
+import pytest
+
+from utils import gzip_io
+from utils.gzip_io import BACKENDS, backend_available, gunzip
+
+PAYLOAD = b"".join(b"record %d\n$$$$\n" % i for i in range(20_000))
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = tmp_path / "Compound_a.sdf.gz"
+    path.write_bytes(gzip.compress(PAYLOAD))
+    return path
+
+
+@pytest.fixture
+def multi_member(tmp_path):
+    """Two concatenated gzip members, a valid .gz that decodes to both parts."""
+    path = tmp_path / "Compound_b.sdf.gz"
+    path.write_bytes(gzip.compress(PAYLOAD[:1000]) + gzip.compress(PAYLOAD[1000:]))
+    return path
+
+
+@pytest.mark.parametrize("backend", [b for b in BACKENDS if backend_available(b)])
+def test_backends_extract_the_same_bytes(tmp_path, archive, multi_member, backend):
+    for path in (archive, multi_member):
+        dest = gunzip(path, tmp_path / backend, backend=backend)
+        assert dest.name == path.stem
+        assert dest.read_bytes() == PAYLOAD
+    assert not list((tmp_path / backend).glob("*.part"))
+
+
+@pytest.mark.skipif(not backend_available("libdeflate"), reason="deflate not installed")
+def test_libdeflate_streams_inputs_it_cannot_decode_in_memory(tmp_path, archive, multi_member, monkeypatch):
+    assert gzip_io._gunzip_libdeflate(archive, tmp_path / "single")
+    assert (tmp_path / "single").read_bytes() == PAYLOAD
+    assert not gzip_io._gunzip_libdeflate(multi_member, tmp_path / "multi")
+    monkeypatch.setattr(gzip_io, "LIBDEFLATE_MAX_INPUT", archive.stat().st_size - 1)
+    assert not gzip_io._gunzip_libdeflate(archive, tmp_path / "large")
+    assert gunzip(archive, tmp_path / "out", backend="libdeflate").read_bytes() == PAYLOAD
+
+
+@pytest.mark.parametrize(
+    "backend, attr, error",
+    [("isal", "_igzip", ImportError), ("libdeflate", "_libdeflate", ImportError), ("pigz", None, FileNotFoundError)],
+)
+def test_requested_backend_missing_raises(tmp_path, archive, monkeypatch, backend, attr, error):
+    if attr is None:
+        monkeypatch.setattr(gzip_io.shutil, "which", lambda name: None)
+    else:
+        monkeypatch.setattr(gzip_io, attr, None)
+    with pytest.raises(error):
+        gunzip(archive, tmp_path, backend=backend)
+    assert not (tmp_path / archive.stem).exists()
+
+
+def test_existing_output_kept_without_overwrite(tmp_path, archive):
+    dest = tmp_path / "out" / archive.stem
+    dest.parent.mkdir()
+    dest.write_bytes(b"old")
+    assert gunzip(archive, dest.parent, overwrite=False).read_bytes() == b"old"
+    assert gunzip(archive, dest.parent).read_bytes() == PAYLOAD
+
+
+FAKE_PIGZ = """#!{python}
+import gzip, sys
+args = sys.argv[1:]
+assert args[:3] == ["-d", "-c", "-p"] and int(args[3]) > 0, args
+with open({log!r}, "a") as log:
+    log.write(" ".join(args[:4]) + "\\n")
+with gzip.open(args[4]) as f:
+    sys.stdout.buffer.write(f.read())
+"""
+
+
+@pytest.fixture
+def fake_pigz(tmp_path, monkeypatch):
+    """A `pigz` on PATH that decodes with the stdlib and logs its flags."""
+    bin_dir, log = tmp_path / "bin", tmp_path / "pigz.log"
+    bin_dir.mkdir()
+    exe = bin_dir / "pigz"
+    exe.write_text(FAKE_PIGZ.format(python=sys.executable, log=str(log)))
+    exe.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return log
+
+
+def test_pigz_runs_one_process_with_threads(tmp_path, archive, fake_pigz):
+    assert backend_available("pigz")
+    dest = gunzip(archive, tmp_path / "out", backend="pigz", threads=3)
+    assert dest.read_bytes() == PAYLOAD
+    assert fake_pigz.read_text() == "-d -c -p 3\n"
+
+
+def test_pigz_failure_leaves_no_output(tmp_path, fake_pigz):
+    broken = tmp_path / "broken.sdf.gz"
+    broken.write_bytes(b"not gzip")
+    with pytest.raises(subprocess.CalledProcessError):
+        gunzip(broken, tmp_path / "out", backend="pigz")
+    assert not list((tmp_path / "out").iterdir())
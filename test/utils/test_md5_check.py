@@ -1,5 +1,76 @@
+import hashlib
 from pathlib import Path
-from nih.pubchem.utils import verify_md5,get_files_by_extension
+
+import pytest
+
+from utils import md5_check
+from utils.files import get_files_by_extension
+from utils.md5_check import verify_md5
+
+
+@pytest.fixture(params=["file_digest", "mmap"])
+def digest_path(request, monkeypatch):
+    """_compute_md5 with hashlib.file_digest (3.11+) and with the mmap fallback."""
+    if request.param == "file_digest" and not hasattr(hashlib, "file_digest"):
+        pytest.skip("hashlib.file_digest needs Python 3.11")
+    if request.param == "mmap":
+        monkeypatch.delattr(hashlib, "file_digest", raising=False)
+
+
+@pytest.mark.parametrize("size", [0, 1, 5 << 20])
+def test_compute_md5_matches_hashlib(tmp_path, digest_path, size):
+    data = bytes(range(256)) * (size // 256) + b"x" * (size % 256)
+    fp = tmp_path / "a.sdf.gz"
+    fp.write_bytes(data)
+    assert md5_check._compute_md5(fp) == hashlib.md5(data).hexdigest()
+
+
+def test_verify_md5(tmp_path, digest_path):
+    fp = tmp_path / "a.sdf.gz"
+    fp.write_bytes(b"payload")
+    md5 = tmp_path / "a.sdf.gz.md5"
+    md5.write_text(f"{hashlib.md5(b'payload').hexdigest()}  a.sdf.gz\n")
+    assert verify_md5(fp, md5)
+    fp.write_bytes(b"changed")
+    assert not verify_md5(fp, md5)
+    with pytest.raises(FileNotFoundError):
+        verify_md5(tmp_path / "missing.gz", md5)
+
+
+HASH = "0123456789abcdef0123456789abcdef"
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        f"{HASH}  Compound_000000001_000500000.sdf.gz\n",
+        f"{HASH}\n",
+        HASH,
+        f"{HASH.upper()}\tname",
+        f"  {HASH}  name\n",  # not at the start: found by the regex search
+        f"MD5 (Compound_000000001_000500000.sdf.gz) = {HASH}\n",
+    ],
+    ids=["md5sum", "hash-newline", "hash-only", "upper-tab", "indented", "bsd"],
+)
+def test_read_expected_md5(tmp_path, content):
+    md5 = tmp_path / "a.md5"
+    md5.write_text(content)
+    assert md5_check._read_expected_md5(md5) == HASH
+
+
+@pytest.mark.parametrize("content", ["", "no hash here\n", HASH[:31] + "\n", HASH + "0123abcd  sha1-like\n"])
+def test_read_expected_md5_without_hash(tmp_path, content):
+    md5 = tmp_path / "a.md5"
+    md5.write_text(content)
+    with pytest.raises(ValueError):
+        md5_check._read_expected_md5(md5)
+
+
+def test_read_expected_md5_missing_sidecar(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        md5_check._read_expected_md5(tmp_path / "a.md5")
+
+
 if __name__=="__main__":
     input_dir = '/data/pubchem_origin_data/compound_current-full_sdf'
     sdf_files=get_files_by_extension(input_dir,extension='.gz')
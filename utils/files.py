@@ -1,34 +1,43 @@
+import os
 from typing import List
-from pathlib import Path
 
 def get_files_by_extension(
-    directory: str, extension: str, exclude_name: str = None
+    directory: str, extension: str, exclude_name: str = None, recursive: bool = True
 ) -> List[str]:
     """
-    检索指定目录及其子目录下特定扩展名的文件
+    检索指定目录(默认含子目录)下特定扩展名的文件
 
     :param directory: 目标目录路径
     :param extension: 扩展名 (如 ".txt" 或 "txt")
     :param exclude_name: 要排除的文件全名 (包含扩展名，如 "config.json")
+    :param recursive: 是否递归搜索子目录; False 时只列出 directory 本身
     :return: 绝对路径字符串列表
     """
     # 确保扩展名以 . 开头
     ext = f".{extension.lstrip('.')}"
 
-    root_path = Path(directory)
-    if not root_path.is_dir():
+    if not os.path.isdir(directory):
         print(f"错误: 路径 {directory} 不是有效的目录")
         return []
 
-    # rglob 代表 recursive glob，即递归搜索
-    # * 表示匹配文件名，{ext} 匹配后缀
+    # 直接使用 os.walk / os.scandir 返回的字符串, 不为每个目录项构造 Path 对象
+    root = os.path.abspath(directory)
     files = []
-    for p in root_path.rglob(f"*{ext}"):
-        # p 是一个 Path 对象，p.name 是带后缀的文件名
-        if exclude_name and p.name == exclude_name:
-            continue
+    if not recursive:
+        with os.scandir(root) as it:
+            for entry in it:
+                # DirEntry.is_file 使用目录遍历时已拿到的类型信息, 通常无需额外 stat
+                if (
+                    entry.name.endswith(ext)
+                    and entry.name != exclude_name
+                    and entry.is_file(follow_symlinks=False)
+                ):
+                    files.append(entry.path)
+        return files
 
-        # 将 Path 对象转换为绝对路径字符串
-        files.append(str(p.absolute()))
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.endswith(ext) and name != exclude_name:
+                files.append(os.path.join(dirpath, name))
 
     return files
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""Gzip extraction with selectable decompression backend."""
+import gzip
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+try:  # optional: Intel ISA-L, streaming drop-in for gzip (~2x zlib)
+    from isal import igzip as _igzip
+except ImportError:
+    _igzip = None
+
+try:  # optional: zran seek-point index, random access into .gz without extracting
+    import indexed_gzip as _indexed_gzip
+except ImportError:
+    _indexed_gzip = None
+
+try:  # optional: libdeflate bindings, whole-buffer decode (~2-3x zlib)
+    import deflate as _libdeflate
+except ImportError:
+    _libdeflate = None
+
+
+BACKENDS = ("isal", "libdeflate", "pigz", "stdlib")
+DEFAULT_BACKEND = "isal" if _igzip is not None else "stdlib"
+COPY_BUFSIZE = 4 * 1024 * 1024  # 流式解压写盘块大小
+# libdeflate 把整个 .gz 读入内存一次解码, 只用于不超过该大小的文件, 更大的文件流式解压
+LIBDEFLATE_MAX_INPUT = 16 * 1024 * 1024
+GZI_SPACING = 1 << 20  # .gzi 索引的 seek point 间隔 (解压后字节)
+GZI_READBUF_SIZE = 1 << 20  # indexed_gzip 读取压缩数据的缓冲区大小
+
+
+def _gunzip_stream(opener, archive: Path, dest: Path) -> None:
+    with opener(archive, "rb") as src, open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst, COPY_BUFSIZE)
+
+
+def _maybe_multi_member(data: bytes) -> bool:
+    """
+    data 中第一个 member 头之后是否还可能有 member 开始 (魔数 1f 8b 08 且 FLG 保留位为 0);
+    压缩数据中偶然出现该字节序列时也返回 True, 只会使调用方改为流式解压
+    """
+    pos = data.find(b"\x1f\x8b\x08", 10)
+    while pos != -1:
+        if pos + 3 < len(data) and not data[pos + 3] & 0xE0:
+            return True
+        pos = data.find(b"\x1f\x8b\x08", pos + 1)
+    return False
+
+
+def _gunzip_libdeflate(archive: Path, dest: Path) -> bool:
+    """
+    libdeflate 只解码第一个 member, 输出缓冲区大小取自文件尾的 ISIZE (只有低 32 位), 输入与输出都在内存中;
+    因此只处理不超过 LIBDEFLATE_MAX_INPUT 的单 member 文件。返回 False 表示需改用流式解压
+    (文件过大, 可能是多 member, 或 ISIZE 回绕即输出 >= 4 GiB 导致解码失败)
+    """
+    if archive.stat().st_size > LIBDEFLATE_MAX_INPUT:
+        return False
+    with open(archive, "rb") as f:
+        data = f.read()
+    if _maybe_multi_member(data):
+        return False
+    try:
+        out = _libdeflate.gzip_decompress(data)
+    except _libdeflate.DeflateError:
+        return False
+    with open(dest, "wb") as dst:
+        dst.write(out)
+    return True
+
+
+def _gunzip_pigz(archive: Path, dest: Path, threads: int = None) -> None:
+    # pigz 单独用线程做读写与 CRC 校验, 适合一次只解一个超大文件
+    cmd = ["pigz", "-d", "-c", "-p", str(threads or os.cpu_count()), str(archive)]
+    with open(dest, "wb") as dst:
+        subprocess.run(cmd, stdout=dst, check=True)
+
+
+def backend_available(backend: str) -> bool:
+    """backend 对应的库 / 可执行文件是否可用"""
+    if backend == "isal":
+        return _igzip is not None
+    if backend == "libdeflate":
+        return _libdeflate is not None
+    if backend == "pigz":
+        return shutil.which("pigz") is not None
+    return backend == "stdlib"
+
+
+def gunzip(
+    archive, dest_dir, overwrite: bool = True, backend: str = None, threads: int = None
+) -> Path:
+    """
+    解压单个 .gz 文件到 dest_dir, 返回解压后的文件路径
+
+    :param backend: "isal" | "libdeflate" | "pigz" | "stdlib"; 默认在安装了 isal 时使用 isal。
+        显式指定但不可用的后端直接报错; libdeflate 处理不了的输入 (见 _gunzip_libdeflate) 改为流式解压
+    :param threads: pigz 使用的线程数, 默认 os.cpu_count()
+    """
+    archive = Path(archive)
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown gzip backend: {backend}")
+    if backend == "pigz" and not backend_available(backend):
+        raise FileNotFoundError("pigz executable not found on PATH")
+    if not backend_available(backend):
+        package = {"isal": "isal", "libdeflate": "deflate"}[backend]
+        raise ImportError(f"{package} is required for the {backend!r} gzip backend")
+
+    if archive.suffix != ".gz":
+        raise ValueError(f"Not a .gz file: {archive}")
+
+    dest = Path(dest_dir) / archive.stem
+    if dest.exists() and not overwrite:
+        return dest
+    os.makedirs(dest_dir, exist_ok=True)
+
+    # 先写临时文件再改名, 避免中断后留下半截的 .sdf
+    tmp = dest.with_name(dest.name + ".part")
+    try:
+        if backend == "pigz":
+            _gunzip_pigz(archive, tmp, threads)
+        elif backend == "libdeflate" and _gunzip_libdeflate(archive, tmp):
+            pass
+        elif backend == "stdlib" or _igzip is None:
+            _gunzip_stream(gzip.open, archive, tmp)
+        else:
+            _gunzip_stream(_igzip.open, archive, tmp)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    os.replace(tmp, dest)
+    return dest
+
+
+def open_indexed_gzip(archive, gzi_path=None):
+    """
+    打开 .gz 以支持随机访问; gzi_path 存在时直接导入已有的 seek point 索引
+    """
+    if _indexed_gzip is None:
+        raise ImportError("indexed_gzip is required for random access into .gz files")
+    kwargs = dict(spacing=GZI_SPACING, readbuf_size=GZI_READBUF_SIZE)
+    if gzi_path is not None and os.path.exists(gzi_path):
+        kwargs["index_file"] = str(gzi_path)
+    return _indexed_gzip.IndexedGzipFile(str(archive), **kwargs)
+
+
+def build_gzip_index(archive, gzi_path=None) -> Path:
+    """
+    为 .gz 构建 seek point 索引并导出为 sidecar (默认 <archive>.gzi), 返回 sidecar 路径
+    """
+    gzi_path = Path(gzi_path) if gzi_path else Path(f"{archive}.gzi")
+    with open_indexed_gzip(archive) as f:
+        f.build_full_index()
+        f.export_index(str(gzi_path))
+    return gzi_path
@@ -1,35 +1,51 @@
 # -*- coding: utf-8 -*-
 """MD5 checksum verification helper."""
 import hashlib
+import mmap
 import os
 import re
 
 
 _MD5_RE = re.compile(r"\b[a-fA-F0-9]{32}\b")
+_HEX_DIGITS = b"0123456789abcdefABCDEF"
+_SIDECAR_HEAD = 64  # "<32 hex>  <filename>": the hash is in the first bytes
 
 
 def _read_expected_md5(md5_file_path):
     if not os.path.isfile(md5_file_path):
         raise FileNotFoundError(md5_file_path)
 
-    with open(md5_file_path, "r", encoding="utf-8") as f:
-        content = f.read()
-
+    with open(md5_file_path, "rb") as f:
+        head = f.read(_SIDECAR_HEAD)
+        # usual layout: 32 hex digits at the start, then whitespace or EOF
+        digest = head[:32]
+        if (
+            len(digest) == 32
+            and not digest.translate(None, _HEX_DIGITS)
+            and (len(head) == 32 or head[32:33].isspace())
+        ):
+            return digest.decode("ascii").lower()
+        data = head + f.read()
+
+    # anything else: search the whole file
+    content = data.decode("utf-8")
     match = _MD5_RE.search(content)
     if not match:
         raise ValueError("No MD5 hash found in md5 file.")
     return match.group(0).lower()
 
 
-def _compute_md5(file_path, chunk_size=1024 * 1024):
+def _compute_md5(file_path):
     if not os.path.isfile(file_path):
         raise FileNotFoundError(file_path)
 
-    md5 = hashlib.md5()
     with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(chunk_size), b""):
-            md5.update(chunk)
-    return md5.hexdigest()
+        if hasattr(hashlib, "file_digest"):  # Python 3.11+: read loop in C, GIL released
+            return hashlib.file_digest(f, "md5").hexdigest()
+        if os.fstat(f.fileno()).st_size == 0:  # mmap cannot map an empty file
+            return hashlib.md5().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return hashlib.md5(mm).hexdigest()
 
 
 def verify_md5(file_path, md5_file_path):